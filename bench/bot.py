@@ -0,0 +1,23 @@
+# bench/bot.py
+"""Бот под нагрузкой: python -m bench.bot (запускается из bench.run)
+
+Это обычный src.main с двумя подменами: Bot API указывает на
+BENCH_TELEGRAM_URL, а instagrapi.Client заменен заглушкой. Остальное
+(Redis, очередь задач, YouTube API через discovery-документ стенда)
+работает как в проде.
+"""
+import asyncio
+import os
+
+from aiogram.client.telegram import TelegramAPIServer
+
+from src import instagram_service
+from src import main as app
+from .fake_instagram import FakeInstagramClient
+
+instagram_service.Client = FakeInstagramClient
+app.bot.session.api = TelegramAPIServer.from_base(os.environ["BENCH_TELEGRAM_URL"])
+
+
+if __name__ == "__main__":
+    asyncio.run(app.main())
@@ -0,0 +1,107 @@
+# bench/fake_instagram.py
+import os
+import random
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+# Параметры задаются стендом через окружение процесса бота
+LATENCY = float(os.getenv("BENCH_IG_LATENCY", "0.2"))
+THREADS = int(os.getenv("BENCH_IG_THREADS", "20"))
+MESSAGES = int(os.getenv("BENCH_IG_MESSAGES", "10"))
+THREADS_PAGE = 20
+# Весь инбокс укладывается в последние 12 часов
+SPAN = 12 * 3600
+NOW = time.time()
+
+
+class FakeInstagramClient:
+    """Заглушка instagrapi.Client с инбоксом заданного размера.
+
+    Каждый вызов блокирует поток на LATENCY (±50%), как сетевой запрос
+    настоящего клиента. Треды и сообщения детерминированы: у треда i
+    сообщения j идут от новых к старым без пересечений с соседями.
+    Страницы private_request отдаются в формате API Instagram, курсор -
+    id самого старого полученного сообщения. Ответ, как и в instagrapi,
+    проходит через общий last_json, поэтому гонка параллельных вызовов
+    на одном клиенте приводит к чужим страницам.
+    """
+
+    def __init__(self, settings: Optional[dict] = None, proxy: Optional[str] = None, **kwargs):
+        self.settings = dict(settings or {})
+        self.proxy = proxy
+        self.last_json: Dict[str, Any] = {}
+
+    @staticmethod
+    def _wait():
+        time.sleep(LATENCY * random.uniform(0.5, 1.5))
+
+    @staticmethod
+    def _timestamp(thread: int, message: int) -> float:
+        return NOW - (thread * MESSAGES + message) * SPAN / max(THREADS * MESSAGES, 1)
+
+    def set_proxy(self, dsn: Optional[str]) -> bool:
+        self.proxy = dsn or None
+        return bool(dsn)
+
+    def get_settings(self) -> Dict[str, Any]:
+        return self.settings
+
+    def login(self, username: str, password: str, verification_code: str = "") -> bool:
+        self._wait()
+        self.settings = {
+            "authorization_data": {"ds_user_id": username, "sessionid": f"bench-{random.getrandbits(64):x}"},
+            "cookies": {},
+            "last_login": time.time(),
+        }
+        return True
+
+    def direct_threads_chunk(self, thread_message_limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[Any], Optional[str]]:
+        self._wait()
+        start = int(cursor or 0)
+        end = min(start + THREADS_PAGE, THREADS)
+        limit = thread_message_limit or MESSAGES
+        threads = [self._thread(index, limit) for index in range(start, end)]
+        return threads, str(end) if end < THREADS else None
+
+    def private_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        params = params or {}
+        thread = int(endpoint.rstrip("/").rsplit("-", 1)[-1])
+        cursor = params.get("cursor")
+        start = int(cursor.rsplit("-", 1)[-1]) + 1 if cursor else 0
+        end = min(start + int(params.get("limit", MESSAGES)), MESSAGES)
+        self.last_json = {"thread": {
+            "items": [self._item(thread, index) for index in range(start, end)],
+            "oldest_cursor": f"{thread}-{end - 1}" if start < end < MESSAGES else None,
+            "has_older": end < MESSAGES,
+        }}
+        self._wait()
+        return self.last_json
+
+    def _thread(self, index: int, limit: int) -> SimpleNamespace:
+        return SimpleNamespace(
+            id=f"bench-thread-{index}",
+            thread_title=f"Тред {index}",
+            users=[SimpleNamespace(username=f"bench_user_{index}")],
+            is_pin=False,
+            last_activity_at=datetime.fromtimestamp(self._timestamp(index, 0), timezone.utc),
+            messages=[
+                SimpleNamespace(
+                    id=f"{index}-{message}",
+                    text=f"Сообщение {message} в треде {index}",
+                    item_type="text",
+                    timestamp=datetime.fromtimestamp(self._timestamp(index, message), timezone.utc),
+                )
+                for message in range(min(limit, MESSAGES))
+            ],
+        )
+
+    def _item(self, thread: int, message: int) -> Dict[str, Any]:
+        return {
+            "item_id": f"{thread}-{message}",
+            "user_id": 1000 + thread,
+            "timestamp": str(int(self._timestamp(thread, message) * 1_000_000)),
+            "item_type": "text",
+            "text": f"Сообщение {message} в треде {thread}",
+        }
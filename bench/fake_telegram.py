@@ -0,0 +1,144 @@
+# bench/fake_telegram.py
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+# Методы, которые возвращают отредактированное сообщение
+EDIT_METHODS = {"editMessageText", "editMessageReplyMarkup", "editMessageCaption"}
+
+
+class FakeTelegram:
+    """Локальная подмена Bot API.
+
+    getUpdates отдает обновления, которые стенд кладет через push_update
+    (long polling, как у настоящего сервера). Вызовы бота с chat_id
+    попадают в ящик чата, откуда их читают симулированные пользователи.
+    Файлы для getFile и скачивания регистрируются в files.
+    """
+
+    def __init__(self, bot_id: int, latency: float = 0.0):
+        self.bot_id = bot_id
+        self.latency = latency
+        self.bot_user = {"id": bot_id, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        self.files: Dict[str, bytes] = {}
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.polling = asyncio.Event()
+        self._updates: List[Dict[str, Any]] = []
+        self._new_update = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._inboxes: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/bot{token}/{method}", self._method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._file)
+        return app
+
+    def push_update(self, update: Dict[str, Any]) -> float:
+        """Новое обновление для getUpdates. Возвращает момент отправки"""
+        update["update_id"] = next(self._update_ids)
+        self._updates.append(update)
+        self._new_update.set()
+        return time.monotonic()
+
+    def inbox(self, chat_id: int) -> asyncio.Queue:
+        """Вызовы бота в чате: {"method", "params", "message_id", "at"}"""
+        return self._inboxes[chat_id]
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    async def _method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = self._params(await request.post())
+        self.calls[method] += 1
+
+        if method.lower() == "getupdates":
+            return self._ok(await self._get_updates(params))
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            return self._ok(self.bot_user)
+        if method == "getFile":
+            file_id = params["file_id"]
+            if file_id not in self.files:
+                return self._error(400, "Bad Request: invalid file_id")
+            return self._ok({
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self.files[file_id]),
+                "file_path": file_id,
+            })
+
+        chat_id = params.get("chat_id")
+        if not isinstance(chat_id, int):
+            return self._ok(True)
+
+        message_id = params.get("message_id") if method in EDIT_METHODS else self.next_message_id()
+        self._inboxes[chat_id].put_nowait({
+            "method": method,
+            "params": params,
+            "message_id": message_id,
+            "at": time.monotonic(),
+        })
+        return self._ok({
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self.bot_user,
+            "text": params.get("text") or params.get("caption") or "",
+        })
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.polling.set()
+        offset = params.get("offset") or 0
+        # Все, что меньше offset, бот подтвердил
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+
+        timeout = params.get("timeout") or 0
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:params.get("limit") or 100]
+
+    async def _file(self, request: web.Request) -> web.Response:
+        content = self.files.get(request.match_info["path"])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content, content_type="application/octet-stream")
+
+    @staticmethod
+    def _params(form: Any) -> Dict[str, Any]:
+        """Поля формы aiogram: сложные значения приходят в JSON"""
+        params = {}
+        for key, value in form.items():
+            if not isinstance(value, str):
+                continue
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        # Текст вида "123" не должен превращаться в число
+        for key in ("text", "caption"):
+            if key in form and isinstance(form[key], str):
+                params[key] = form[key]
+        return params
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code: int, description: str) -> web.Response:
+        return web.json_response({"ok": False, "error_code": code, "description": description}, status=code)
@@ -0,0 +1,110 @@
+# bench/fake_youtube.py
+import asyncio
+import json
+import re
+import uuid
+from typing import Any, Dict, List
+
+from aiohttp import web
+from googleapiclient.discovery_cache import get_static_doc
+
+CONTENT_RANGE = re.compile(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)")
+
+
+class FakeYouTube:
+    """Локальная подмена OAuth и YouTube Data API.
+
+    /token выдает токены на любой код, channels.list возвращает каналы
+    стенда, videos.insert работает по протоколу resumable upload
+    (308 с заголовком Range до получения последнего байта).
+    """
+
+    def __init__(self, channels: int = 3, latency: float = 0.0):
+        self.channels = channels
+        self.latency = latency
+        self.base_url = ""
+        self.uploaded_bytes = 0
+        self.videos = 0
+        self._sessions: Dict[str, Dict[str, int]] = {}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/token", self._token)
+        app.router.add_get("/youtube/v3/channels", self._channels)
+        app.router.add_post("/upload/youtube/v3/videos", self._start_upload)
+        app.router.add_put("/upload/session/{session_id}", self._upload_chunk)
+        return app
+
+    def discovery_document(self) -> Dict[str, Any]:
+        """Статический discovery-документ YouTube с адресами стенда"""
+        document = json.loads(get_static_doc("youtube", "v3"))
+        document["rootUrl"] = document["mtlsRootUrl"] = f"{self.base_url}/"
+        document["baseUrl"] = f"{self.base_url}/{document.get('servicePath', '')}"
+        return document
+
+    def client_secrets(self) -> bytes:
+        """client_secrets.json, у которого обмен кода идет на стенд"""
+        return json.dumps({"installed": {
+            "client_id": "bench.apps.googleusercontent.com",
+            "client_secret": "bench-secret",
+            "auth_uri": f"{self.base_url}/auth",
+            "token_uri": f"{self.base_url}/token",
+            "redirect_uris": ["urn:ietf:wg:oauth:2.0:oob"],
+        }}).encode()
+
+    def channel_items(self) -> List[Dict[str, Any]]:
+        return [
+            {"id": f"UCbench{index}", "snippet": {"title": f"Канал {index + 1}"}}
+            for index in range(self.channels)
+        ]
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def _token(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({
+            "access_token": f"bench-{uuid.uuid4().hex}",
+            "refresh_token": "bench-refresh",
+            "expires_in": 3600,
+            "token_type": "Bearer",
+            "scope": "https://www.googleapis.com/auth/youtube",
+        })
+
+    async def _channels(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"items": self.channel_items()})
+
+    async def _start_upload(self, request: web.Request) -> web.Response:
+        await self._delay()
+        await request.read()
+        session_id = uuid.uuid4().hex
+        self._sessions[session_id] = {
+            "received": 0,
+            "total": int(request.headers.get("X-Upload-Content-Length", "0")),
+        }
+        return web.Response(headers={"Location": f"{self.base_url}/upload/session/{session_id}"})
+
+    async def _upload_chunk(self, request: web.Request) -> web.Response:
+        await self._delay()
+        session = self._sessions.get(request.match_info["session_id"])
+        if session is None:
+            raise web.HTTPNotFound()
+
+        body = await request.read()
+        match = CONTENT_RANGE.match(request.headers.get("Content-Range", ""))
+        if match and match.group(3) != "*":
+            session["total"] = int(match.group(3))
+        if body:
+            start = int(match.group(1)) if match and match.group(1) else session["received"]
+            session["received"] = max(session["received"], start + len(body))
+            self.uploaded_bytes += len(body)
+
+        if session["total"] and session["received"] >= session["total"]:
+            del self._sessions[request.match_info["session_id"]]
+            self.videos += 1
+            return web.json_response({"id": f"vid{uuid.uuid4().hex[:11]}", "kind": "youtube#video"})
+
+        headers = {"Range": f"bytes=0-{session['received'] - 1}"} if session["received"] else {}
+        return web.Response(status=308, headers=headers)
@@ -0,0 +1,245 @@
+# bench/run.py
+"""Нагрузочный стенд бота: python -m bench.run --users 50
+
+Поднимает локальные подмены Bot API и YouTube (OAuth, channels.list,
+resumable upload), запускает настоящий бот (bench.bot) отдельным процессом
+с заглушкой instagrapi и гоняет N одновременных пользователей по сценариям
+авторизации, отчета Instagram и мультиканальной загрузки YouTube.
+
+Итог: p50/p99 задержек по шагам, обновлений в секунду, пиковый RSS и
+процессорное время бота. С --json результаты пишутся в файл для сравнения
+прогонов.
+
+Нужен локальный Redis. База из --redis-url ОЧИЩАЕТСЯ перед прогоном,
+поэтому по умолчанию используется отдельная база 15.
+Настройки бота (SEND_CHAT_RATE, UPDATES_MAX_CONCURRENCY, ...) берутся из
+окружения, как и в проде.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import psutil
+from aiohttp import web
+from cryptography.fernet import Fernet
+from redis.asyncio import Redis
+
+from .fake_telegram import FakeTelegram
+from .fake_youtube import FakeYouTube
+from .users import SimulatedUser, Stats
+
+ROOT = Path(__file__).resolve().parent.parent
+BOT_ID = 100000001
+BOT_TOKEN = f"{BOT_ID}:bench-token"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный стенд бота")
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей")
+    parser.add_argument("--flows", default="instagram,youtube", help="сценарии через запятую: instagram, youtube")
+    parser.add_argument("--rounds", type=int, default=1, help="повторов сценариев каждым пользователем")
+    parser.add_argument("--ramp", type=float, default=5, help="секунд на подключение всех пользователей")
+    parser.add_argument("--think", type=float, default=1.0, help="средняя пауза пользователя между действиями")
+    parser.add_argument("--timeout", type=float, default=30, help="ожидание ответа бота на шаг")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--tg-latency", type=float, default=0.0, help="задержка Bot API")
+    parser.add_argument("--ig-latency", type=float, default=0.2, help="задержка вызова instagrapi")
+    parser.add_argument("--ig-threads", type=int, default=20, help="тредов в инбоксе")
+    parser.add_argument("--ig-messages", type=int, default=10, help="сообщений в треде")
+    parser.add_argument("--yt-latency", type=float, default=0.05, help="задержка запроса к YouTube")
+    parser.add_argument("--yt-channels", type=int, default=3, help="каналов у пользователя")
+    parser.add_argument("--upload-channels", type=int, default=2, help="каналов в мультизагрузке")
+    parser.add_argument("--video-mb", type=float, default=4, help="размер видео")
+    parser.add_argument("--json", dest="json_path", help="файл для результатов")
+    parser.add_argument("--keep-workdir", action="store_true", help="не удалять рабочий каталог бота")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve(app: web.Application) -> Tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    await web.SockSite(runner, sock).start()
+    return runner, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def bot_environment(args: argparse.Namespace, telegram_url: str, discovery: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")])),
+        "TELEGRAM_TOKEN": BOT_TOKEN,
+        "REDIS_URL": args.redis_url,
+        "ENCRYPTION_KEY": Fernet.generate_key().decode(),
+        "ENCRYPTION_OLD_KEYS": "",
+        "BOT_MODE": "polling",
+        "JOB_WORKERS_EMBEDDED": "True",
+        "METRICS_PORT": str(free_port()),
+        "VPN_REQUIRED": "False",
+        "INSTAGRAM_PROXY": "",
+        "INSTAGRAM_PROXY_POOL": "",
+        "YT_DISCOVERY_DOC": str(discovery),
+        "YT_CONTENT_OWNER": "bench-owner",
+        # Токены стенда выдаются по http
+        "OAUTHLIB_INSECURE_TRANSPORT": "1",
+        "OAUTHLIB_RELAX_TOKEN_SCOPE": "1",
+        "BENCH_TELEGRAM_URL": telegram_url,
+        "BENCH_IG_LATENCY": str(args.ig_latency),
+        "BENCH_IG_THREADS": str(args.ig_threads),
+        "BENCH_IG_MESSAGES": str(args.ig_messages),
+    })
+    return env
+
+
+async def sample_memory(process: psutil.Process, peak: Dict[str, int]):
+    """Пиковый RSS процесса бота"""
+    while True:
+        try:
+            peak["rss"] = max(peak["rss"], process.memory_info().rss)
+        except psutil.Error:
+            return
+        await asyncio.sleep(0.1)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    flows = [flow.strip() for flow in args.flows.split(",") if flow.strip()]
+    redis = Redis.from_url(args.redis_url)
+    await redis.flushdb()
+    await redis.aclose()
+
+    telegram = FakeTelegram(BOT_ID, latency=args.tg_latency)
+    youtube = FakeYouTube(channels=args.yt_channels, latency=args.yt_latency)
+    telegram_runner, telegram_url = await serve(telegram.app())
+    youtube_runner, youtube.base_url = await serve(youtube.app())
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-"))
+    (workdir / "logs").mkdir()
+    (workdir / "temp").mkdir()
+    discovery = workdir / "youtube_discovery.json"
+    discovery.write_text(json.dumps(youtube.discovery_document()))
+
+    log = open(workdir / "bot.out", "wb")
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bench.bot",
+        cwd=workdir,
+        env=bot_environment(args, telegram_url, discovery),
+        stdout=log,
+        stderr=log
+    )
+    process = psutil.Process(bot.pid)
+    peak = {"rss": 0}
+    sampler = asyncio.create_task(sample_memory(process, peak))
+
+    try:
+        ready = asyncio.create_task(telegram.polling.wait())
+        exited = asyncio.create_task(bot.wait())
+        await asyncio.wait({ready, exited}, timeout=60, return_when=asyncio.FIRST_COMPLETED)
+        exited.cancel()
+        if not ready.done():
+            ready.cancel()
+            raise RuntimeError(f"Бот не начал polling, см. {workdir / 'bot.out'}")
+
+        stats = Stats()
+        video = os.urandom(int(args.video_mb * 1024 * 1024))
+        expected_lines = min(int(os.getenv("INSTAGRAM_REPORT_LIMIT", "50")), args.ig_threads * args.ig_messages)
+        users = [
+            SimulatedUser(
+                user_id=200000000 + index,
+                telegram=telegram,
+                youtube=youtube,
+                stats=stats,
+                think=args.think,
+                timeout=args.timeout,
+                video=video,
+                upload_channels=args.upload_channels
+            )
+            for index in range(args.users)
+        ]
+
+        async def start(index: int, user: SimulatedUser):
+            await asyncio.sleep(args.ramp * index / max(args.users, 1))
+            await user.run(flows, args.rounds, expected_lines)
+
+        cpu_before = process.cpu_times()
+        started_at = time.monotonic()
+        await asyncio.gather(*(start(index, user) for index, user in enumerate(users)))
+        elapsed = time.monotonic() - started_at
+        cpu_after = process.cpu_times()
+    finally:
+        sampler.cancel()
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(bot.wait(), 30)
+            except asyncio.TimeoutError:
+                bot.kill()
+                await bot.wait()
+        log.close()
+        await telegram_runner.cleanup()
+        await youtube_runner.cleanup()
+
+    result = {
+        "users": args.users,
+        "flows": flows,
+        "rounds": args.rounds,
+        "elapsed": elapsed,
+        "updates": stats.updates,
+        "updates_per_second": stats.updates / elapsed if elapsed else 0,
+        "bot_api_calls": dict(telegram.calls),
+        "youtube_uploaded_mb": youtube.uploaded_bytes / 1024 / 1024,
+        "youtube_videos": youtube.videos,
+        "peak_rss_mb": peak["rss"] / 1024 / 1024,
+        "bot_cpu_seconds": (cpu_after.user + cpu_after.system) - (cpu_before.user + cpu_before.system),
+        "steps": stats.summary(),
+        "errors": dict(stats.errors),
+        "last_errors": stats.last_error,
+        "workdir": str(workdir),
+    }
+    if not args.keep_workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"\nПользователей: {result['users']}, сценарии: {', '.join(result['flows'])}, повторов: {result['rounds']}")
+    print(f"Длительность: {result['elapsed']:.1f} сек.")
+    print(f"{'Шаг':<40} {'n':>6} {'p50, мс':>10} {'p99, мс':>10} {'max, мс':>10}")
+    for step, values in result["steps"].items():
+        print(
+            f"{step:<40} {values['count']:>6} {values['p50'] * 1000:>10.1f} "
+            f"{values['p99'] * 1000:>10.1f} {values['max'] * 1000:>10.1f}"
+        )
+    print(f"\nОбновлений: {result['updates']} ({result['updates_per_second']:.1f}/сек.)")
+    print(f"Вызовов Bot API: {sum(result['bot_api_calls'].values())}")
+    print(f"Загружено в YouTube: {result['youtube_uploaded_mb']:.1f} МБ, видео: {result['youtube_videos']}")
+    print(f"Пиковый RSS бота: {result['peak_rss_mb']:.1f} МБ, CPU: {result['bot_cpu_seconds']:.1f} сек.")
+    for flow, count in result["errors"].items():
+        print(f"Ошибок в сценарии {flow}: {count} (последняя: {result['last_errors'][flow]})")
+
+
+def main():
+    args = parse_args()
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
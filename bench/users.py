@@ -0,0 +1,278 @@
+# bench/users.py
+import asyncio
+import itertools
+import math
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from .fake_telegram import FakeTelegram
+from .fake_youtube import FakeYouTube
+
+# Строка отчета Instagram: "дд.мм.гггг чч:мм @user: текст"
+REPORT_LINE = re.compile(r"^\d{2}\.\d{2}\.\d{4} \d{2}:\d{2} @")
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+
+def text(prefix: str) -> Predicate:
+    return lambda call: str(call["params"].get("text", "")).startswith(prefix)
+
+
+def method(name: str) -> Predicate:
+    return lambda call: call["method"] == name
+
+
+class FlowError(Exception):
+    pass
+
+
+class Stats:
+    """Задержки шагов сценариев и ошибки"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.last_error: Dict[str, str] = {}
+        self.updates = 0
+
+    def record(self, step: str, seconds: float):
+        self.samples[step].append(seconds)
+
+    def error(self, flow: str, reason: str):
+        self.errors[flow] += 1
+        self.last_error[flow] = reason
+
+    @staticmethod
+    def percentile(values: List[float], q: float) -> float:
+        ordered = sorted(values)
+        return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for step, values in self.samples.items():
+            result[step] = {
+                "count": len(values),
+                "p50": self.percentile(values, 0.5),
+                "p99": self.percentile(values, 0.99),
+                "max": max(values),
+            }
+        return result
+
+
+class SimulatedUser:
+    """Пользователь Telegram, проходящий сценарии бота.
+
+    Каждый шаг - обновление в getUpdates и ожидание нужного ответа бота
+    в ящике чата. Задержка шага - от отправки обновления до вызова Bot API,
+    которым бот ответил. Ответы с ❌ или ⚠️ считаются ошибкой сценария.
+    """
+
+    def __init__(
+            self,
+            user_id: int,
+            telegram: FakeTelegram,
+            youtube: FakeYouTube,
+            stats: Stats,
+            think: float,
+            timeout: float,
+            video: bytes,
+            upload_channels: int
+    ):
+        self.user_id = user_id
+        self.telegram = telegram
+        self.youtube = youtube
+        self.stats = stats
+        self.think = think
+        self.timeout = timeout
+        self.video = video
+        self.upload_channels = upload_channels
+        self.inbox = telegram.inbox(user_id)
+        self._message_ids = itertools.count(1)
+
+    # region [ UPDATES ]
+    def _user(self) -> Dict[str, Any]:
+        return {"id": self.user_id, "is_bot": False, "first_name": f"Bench {self.user_id}"}
+
+    def _chat(self) -> Dict[str, Any]:
+        return {"id": self.user_id, "type": "private"}
+
+    def _message(self, **fields) -> Dict[str, Any]:
+        return {"message": {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(),
+            "from": self._user(),
+            **fields,
+        }}
+
+    def text_update(self, value: str) -> Dict[str, Any]:
+        fields = {"text": value}
+        if value.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(value.split()[0])}]
+        return self._message(**fields)
+
+    def document_update(self, file_id: str, file_name: str) -> Dict[str, Any]:
+        return self._message(document={
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_name": file_name,
+            "file_size": len(self.telegram.files[file_id]),
+        })
+
+    def video_update(self, file_id: str) -> Dict[str, Any]:
+        return self._message(video={
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "width": 1280,
+            "height": 720,
+            "duration": 10,
+            "file_size": len(self.telegram.files[file_id]),
+        })
+
+    def callback_update(self, reply: Dict[str, Any], data: str) -> Dict[str, Any]:
+        return {"callback_query": {
+            "id": uuid.uuid4().hex,
+            "from": self._user(),
+            "chat_instance": str(self.user_id),
+            "data": data,
+            "message": {
+                "message_id": reply["message_id"],
+                "date": int(time.time()),
+                "chat": self._chat(),
+                "from": self.telegram.bot_user,
+                "text": reply["params"].get("text", ""),
+            },
+        }}
+    # endregion
+
+    async def act(self, update: Dict[str, Any]) -> float:
+        """Пауза "на раздумье" и отправка обновления"""
+        await asyncio.sleep(self.think * random.uniform(0.5, 1.5))
+        self.stats.updates += 1
+        return self.telegram.push_update(update)
+
+    async def expect(
+            self,
+            step: Optional[str],
+            started: float,
+            predicate: Predicate,
+            timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Ожидание ответа бота, удовлетворяющего predicate"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise FlowError(f"{step}: нет ответа")
+            try:
+                call = await asyncio.wait_for(self.inbox.get(), remaining)
+            except asyncio.TimeoutError:
+                raise FlowError(f"{step}: нет ответа")
+            if predicate(call):
+                if step:
+                    self.stats.record(step, call["at"] - started)
+                return call
+            reply = str(call["params"].get("text", ""))
+            if reply.startswith(("❌", "⚠️")):
+                raise FlowError(f"{step}: {reply[:200]}")
+
+    # region [ FLOWS ]
+    async def youtube_auth(self) -> Dict[str, Any]:
+        """Авторизация YouTube. Возвращает сообщение с выбором канала"""
+        started = await self.act(self.text_update("/auth"))
+        await self.expect("youtube: /auth", started, text("📤 Отправьте файл client_secrets.json"))
+
+        file_id = f"secrets-{self.user_id}"
+        self.telegram.files[file_id] = self.youtube.client_secrets()
+        started = await self.act(self.document_update(file_id, "client_secrets.json"))
+        await self.expect("youtube: client_secrets", started, text("🔑"))
+
+        started = await self.act(self.text_update("bench-code"))
+        await self.expect("youtube: обмен кода", started, text("✅ Авторизация успешна"))
+        return await self.expect("youtube: список каналов", started, text("📡 Выберите канал"))
+
+    async def youtube_upload(self, channels_message: Dict[str, Any]):
+        """Мультиканальная загрузка видео через очередь задач"""
+        keyboard = channels_message["params"]["reply_markup"]["inline_keyboard"]
+        started = await self.act(self.callback_update(channels_message, keyboard[0][0]["callback_data"]))
+        menu = await self.expect("youtube: выбор канала", started, text("📤 Выберите тип контента"))
+
+        started = await self.act(self.callback_update(menu, "multi_channel"))
+        selection = await self.expect("youtube: мультиканальная загрузка", started, text("📡 Отметьте каналы"))
+
+        rows = selection["params"]["reply_markup"]["inline_keyboard"][:-1]
+        for row in rows[:self.upload_channels]:
+            started = await self.act(self.callback_update(selection, row[0]["callback_data"]))
+            await self.expect("youtube: отметка канала", started, method("editMessageReplyMarkup"))
+
+        started = await self.act(self.callback_update(selection, "mc_done"))
+        await self.expect("youtube: выбор завершен", started, text("Введите шаблон метаданных"))
+
+        started = await self.act(self.text_update("Bench {channel}\nНагрузочный тест\nbench,load\nсейчас"))
+        await self.expect("youtube: метаданные", started, text("📤 Отправьте видео"))
+
+        file_id = f"video-{self.user_id}"
+        self.telegram.files[file_id] = self.video
+        started = await self.act(self.video_update(file_id))
+        await self.expect("youtube: видео в очереди", started, text("📥 Видео поставлено"))
+        result = await self.expect(
+            "youtube: загрузка на каналы",
+            started,
+            text("📊 Результаты загрузки"),
+            timeout=self.timeout * 10
+        )
+        if "❌" in result["params"]["text"]:
+            raise FlowError(f"загрузка: {result['params']['text'][:200]}")
+
+    async def instagram_auth(self):
+        started = await self.act(self.text_update("/instagram_auth"))
+        await self.expect("instagram: /instagram_auth", started, text("📩"))
+
+        started = await self.act(self.text_update(f"login:bench{self.user_id}\npassword:bench"))
+        await self.expect("instagram: вход", started, text("✅ Успешная авторизация"))
+        await self.expect(None, started, text("⏳ Введите временной диапазон"))
+
+    async def instagram_report(self, expected_lines: int):
+        started = await self.act(self.text_update("24"))
+        await self.expect("instagram: первый ответ", started, text("⏳ Собираю сообщения"))
+
+        lines = 0
+        finished = started
+        while lines < expected_lines:
+            call = await self.expect(None, started, text(""), timeout=self.timeout * 10)
+            finished = call["at"]
+            reply = str(call["params"].get("text", ""))
+            if reply.startswith(("❌", "⚠️")):
+                raise FlowError(f"отчет: {reply[:200]}")
+            if reply.startswith("📭"):
+                raise FlowError("отчет: нет сообщений")
+            lines += sum(1 for line in reply.split("\n") if REPORT_LINE.match(line))
+        self.stats.record("instagram: отчет целиком", finished - started)
+    # endregion
+
+    async def run(self, flows: List[str], rounds: int, expected_lines: int):
+        for _ in range(rounds):
+            for flow in flows:
+                try:
+                    if flow == "youtube":
+                        await self.youtube_upload(await self.youtube_auth())
+                    elif flow == "instagram":
+                        await self.instagram_auth()
+                        await self.instagram_report(expected_lines)
+                except FlowError as e:
+                    self.stats.error(flow, str(e))
+                    await self._reset()
+
+    async def _reset(self):
+        """Синхронизация с ботом и очистка ящика после сбоя сценария"""
+        started = await self.act(self.text_update("/start"))
+        try:
+            await self.expect(None, started, text("🌟"))
+        except FlowError:
+            pass
+        while not self.inbox.empty():
+            self.inbox.get_nowait()
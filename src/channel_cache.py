@@ -0,0 +1,78 @@
+# src/channel_cache.py
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from .utils import storage
+
+logger = logging.getLogger(__name__)
+
+Channels = List[Tuple[str, str]]
+
+
+class ChannelCache:
+    """Кэш списка YouTube-каналов пользователя в Redis (stale-while-revalidate).
+
+    Ключ yt_channels:{user_id} хранит JSON со списком каналов и временем
+    загрузки. Свежие данные (моложе ttl) отдаются как есть; устаревшие
+    (моложе ttl + stale_ttl) отдаются сразу, а обновление уходит в фон.
+    Фоновое обновление выполняет одна реплика бота - под блокировкой SET NX.
+    """
+
+    def __init__(
+            self,
+            fetch: Callable[[int], Awaitable[Channels]],
+            ttl: Optional[int] = None,
+            stale_ttl: Optional[int] = None
+    ):
+        self._fetch = fetch
+        self.ttl = ttl or int(os.getenv("YT_CHANNELS_TTL", "3600"))
+        self.stale_ttl = stale_ttl or int(os.getenv("YT_CHANNELS_STALE_TTL", "86400"))
+        self._refreshing: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"yt_channels:{user_id}"
+
+    async def get(self, user_id: int) -> Channels:
+        raw = await storage.redis.get(self._key(user_id))
+        if raw is None:
+            return await self.refresh(user_id)
+
+        cached = json.loads(raw)
+        channels = [tuple(item) for item in cached["channels"]]
+        if time.time() - cached["fetched_at"] > self.ttl:
+            await self._refresh_in_background(user_id)
+        return channels
+
+    async def refresh(self, user_id: int) -> Channels:
+        """Загрузка списка из API с сохранением в кэш"""
+        channels = await self._fetch(user_id)
+        await storage.redis.set(
+            self._key(user_id),
+            json.dumps({"channels": channels, "fetched_at": time.time()}),
+            ex=self.ttl + self.stale_ttl
+        )
+        return channels
+
+    async def invalidate(self, user_id: int):
+        await storage.redis.delete(self._key(user_id))
+
+    async def _refresh_in_background(self, user_id: int):
+        lock_acquired = await storage.redis.set(f"yt_channels_lock:{user_id}", 1, nx=True, ex=60)
+        if not lock_acquired:
+            return
+        task = asyncio.create_task(self._background_refresh(user_id))
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+
+    async def _background_refresh(self, user_id: int):
+        try:
+            await self.refresh(user_id)
+        except Exception as e:
+            logger.warning(f"Фоновое обновление каналов {user_id} не удалось: {str(e)}")
+        finally:
+            await storage.redis.delete(f"yt_channels_lock:{user_id}")
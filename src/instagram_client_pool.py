@@ -0,0 +1,173 @@
+# src/instagram_client_pool.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from instagrapi import Client
+
+logger = logging.getLogger(__name__)
+
+# Грубая оценка памяти клиента без учета настроек (сессии requests, пулы соединений)
+CLIENT_BASE_BYTES = 256 * 1024
+
+
+class _PoolEntry:
+    __slots__ = ("client", "digest", "size", "last_used", "last_saved", "dirty")
+
+    def __init__(self, client: Client, digest: str, size: int):
+        self.client = client
+        self.digest = digest
+        self.size = size
+        self.last_used = time.monotonic()
+        self.last_saved = self.last_used
+        self.dirty = False
+
+
+class InstagramClientPool:
+    """Процессный кэш авторизованных клиентов instagrapi по user_id.
+
+    Клиенты живут между запросами вместе с HTTP-сессиями и cookies.
+    Вытеснение: LRU, простой дольше idle_ttl и суммарный лимит памяти.
+    Изменения сессии записываются в Redis лениво: не чаще writeback_interval
+    и обязательно при вытеснении, инвалидации и остановке.
+
+    Один клиент выдается всем параллельным запросам пользователя, а Client
+    не потокобезопасен: параллельные вызовы должны идти под блокировкой
+    или через копию из get_settings() (см. DirectFetcher).
+    """
+
+    def __init__(
+            self,
+            build: Callable[[int], Awaitable[Client]],
+            save: Callable[[int, Client], Awaitable[None]],
+            max_clients: Optional[int] = None,
+            idle_ttl: Optional[float] = None,
+            max_bytes: Optional[int] = None,
+            writeback_interval: Optional[float] = None
+    ):
+        self._build = build
+        self._save = save
+        self.max_clients = max_clients or int(os.getenv("INSTAGRAM_POOL_MAX_CLIENTS", "100"))
+        self.idle_ttl = idle_ttl or float(os.getenv("INSTAGRAM_POOL_IDLE_TTL", "1800"))
+        self.max_bytes = max_bytes or int(os.getenv("INSTAGRAM_POOL_MAX_MB", "64")) * 1024 * 1024
+        self.writeback_interval = writeback_interval or float(os.getenv("INSTAGRAM_POOL_WRITEBACK", "300"))
+        self._entries: "OrderedDict[int, _PoolEntry]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiting: Dict[int, int] = {}
+        self._total_bytes = 0
+
+    @staticmethod
+    def _snapshot(client: Client):
+        raw = json.dumps(client.get_settings(), sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest(), CLIENT_BASE_BYTES + len(raw)
+
+    async def get(self, user_id: int) -> Client:
+        """Теплый клиент пользователя или новый из сохраненной сессии"""
+        await self._evict_idle()
+        if entry := self._touch(user_id):
+            return entry.client
+
+        # Блокировка живет, пока ее ждет хотя бы один запрос, в том числе при ошибке сборки
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self._waiting[user_id] = self._waiting.get(user_id, 0) + 1
+        try:
+            async with lock:
+                if entry := self._touch(user_id):
+                    return entry.client
+                client = await self._build(user_id)
+                self._store(user_id, client)
+        finally:
+            self._waiting[user_id] -= 1
+            if not self._waiting[user_id]:
+                del self._waiting[user_id]
+                del self._locks[user_id]
+
+        await self._enforce_limits()
+        return client
+
+    async def put(self, user_id: int, client: Client):
+        """Регистрация нового клиента (после логина) с немедленным сохранением"""
+        await self.invalidate(user_id, save=False)
+        entry = self._store(user_id, client)
+        await self._save(user_id, client)
+        entry.last_saved = time.monotonic()
+        await self._enforce_limits()
+
+    async def release(self, user_id: int):
+        """Отметка об окончании работы с клиентом и отложенная запись сессии"""
+        entry = self._entries.get(user_id)
+        if not entry:
+            return
+        self._refresh(entry)
+        if entry.dirty and time.monotonic() - entry.last_saved >= self.writeback_interval:
+            await self._write_back(user_id, entry)
+
+    async def invalidate(self, user_id: int, save: bool = True):
+        """Удаление клиента из пула (например, при смене прокси)"""
+        entry = self._entries.get(user_id)
+        if not entry:
+            return
+        if save:
+            self._refresh(entry)
+        del self._entries[user_id]
+        self._total_bytes -= entry.size
+        if save:
+            await self._write_back(user_id, entry)
+
+    async def flush(self):
+        """Запись всех измененных сессий (при остановке бота)"""
+        for user_id, entry in list(self._entries.items()):
+            self._refresh(entry)
+            await self._write_back(user_id, entry)
+
+    def _touch(self, user_id: int) -> Optional[_PoolEntry]:
+        entry = self._entries.get(user_id)
+        if entry:
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(user_id)
+        return entry
+
+    def _refresh(self, entry: _PoolEntry):
+        digest, size = self._snapshot(entry.client)
+        self._total_bytes += size - entry.size
+        entry.size = size
+        if digest != entry.digest:
+            entry.digest = digest
+            entry.dirty = True
+
+    def _store(self, user_id: int, client: Client) -> _PoolEntry:
+        digest, size = self._snapshot(client)
+        entry = _PoolEntry(client, digest, size)
+        self._entries[user_id] = entry
+        self._total_bytes += size
+        return entry
+
+    async def _write_back(self, user_id: int, entry: _PoolEntry):
+        if not entry.dirty:
+            return
+        try:
+            await self._save(user_id, entry.client)
+            entry.dirty = False
+            entry.last_saved = time.monotonic()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения сессии Instagram {user_id}: {str(e)}")
+
+    async def _evict_idle(self):
+        deadline = time.monotonic() - self.idle_ttl
+        while self._entries:
+            user_id, entry = next(iter(self._entries.items()))
+            if entry.last_used > deadline:
+                break
+            await self.invalidate(user_id)
+
+    async def _enforce_limits(self):
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_clients or self._total_bytes > self.max_bytes
+        ):
+            user_id = next(iter(self._entries))
+            await self.invalidate(user_id)
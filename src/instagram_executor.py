@@ -0,0 +1,121 @@
+# src/instagram_executor.py
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import INSTAGRAM_ERRORS, INSTAGRAM_SECONDS, track
+
+logger = logging.getLogger(__name__)
+
+
+class InstagramExecutor:
+    """Пул потоков для блокирующих вызовов instagrapi.
+
+    Все обращения к Client выполняются вне event loop. Для каждого
+    пользователя действует собственный лимит параллельных вызовов, чтобы
+    один тяжелый запрос не занимал весь пул.
+    """
+
+    def __init__(
+            self,
+            max_workers: Optional[int] = None,
+            per_user_limit: Optional[int] = None,
+            timeout: Optional[float] = None,
+            on_result: Optional[Callable[[Optional[str], Optional[BaseException]], None]] = None
+    ):
+        # Итог каждого вызова: прокси клиента и исключение (None при успехе)
+        self.on_result = on_result
+        self.max_workers = max_workers or int(os.getenv("INSTAGRAM_EXECUTOR_WORKERS", "8"))
+        self.per_user_limit = per_user_limit or int(os.getenv("INSTAGRAM_USER_CONCURRENCY", "4"))
+        self.timeout = timeout or float(os.getenv("INSTAGRAM_CALL_TIMEOUT", "60"))
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="instagrapi"
+        )
+        self._slots: Dict[int, asyncio.Semaphore] = {}
+        self._inflight: Dict[int, int] = {}
+
+    def _acquire_slot(self, user_id: int) -> asyncio.Semaphore:
+        if user_id not in self._slots:
+            self._slots[user_id] = asyncio.Semaphore(self.per_user_limit)
+        self._inflight[user_id] = self._inflight.get(user_id, 0) + 1
+        return self._slots[user_id]
+
+    def _release_slot(self, user_id: int, acquired: bool):
+        if acquired:
+            self._slots[user_id].release()
+        self._inflight[user_id] -= 1
+        if not self._inflight[user_id]:
+            del self._inflight[user_id]
+            del self._slots[user_id]
+
+    async def run(
+            self,
+            user_id: int,
+            func: Callable[..., Any],
+            *args,
+            timeout: Optional[float] = None,
+            **kwargs
+    ) -> Any:
+        """Выполнение func(*args, **kwargs) в пуле с таймаутом.
+
+        Слот пользователя освобождается только после фактического
+        завершения потока, поэтому лимит соблюдается и при таймаутах.
+        """
+        loop = asyncio.get_running_loop()
+        slot = self._acquire_slot(user_id)
+        try:
+            await slot.acquire()
+        except BaseException:
+            self._release_slot(user_id, acquired=False)
+            raise
+
+        try:
+            future = self._pool.submit(functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._release_slot(user_id, acquired=True)
+            raise
+
+        def _on_done(_):
+            try:
+                loop.call_soon_threadsafe(self._release_slot, user_id, True)
+            except RuntimeError:
+                # Event loop уже закрыт при остановке бота
+                pass
+
+        future.add_done_callback(_on_done)
+
+        name = getattr(func, "__name__", repr(func))
+        proxy = self._client_proxy(func, args)
+        try:
+            with track(INSTAGRAM_SECONDS, INSTAGRAM_ERRORS, method=name):
+                result = await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError as e:
+            logger.warning(f"Таймаут вызова instagrapi {name} для {user_id}")
+            self._report(proxy, e)
+            raise
+        except Exception as e:
+            self._report(proxy, e)
+            raise
+        self._report(proxy, None)
+        return result
+
+    @staticmethod
+    def _client_proxy(func: Callable[..., Any], args: tuple) -> Optional[str]:
+        """Прокси клиента: func - метод Client или первым аргументом передан Client"""
+        for target in (getattr(func, "__self__", None), *args[:1]):
+            proxy = getattr(target, "proxy", None)
+            if isinstance(proxy, str):
+                return proxy
+        return None
+
+    def _report(self, proxy: Optional[str], error: Optional[BaseException]):
+        if self.on_result:
+            self.on_result(proxy, error)
+
+    def shutdown(self):
+        """Остановка пула без ожидания зависших запросов"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,227 @@
+# src/instagram_fetcher.py
+import asyncio
+import logging
+import math
+import os
+import weakref
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from instagrapi import Client
+from instagrapi.extractors import extract_direct_message
+from instagrapi.types import DirectThread
+
+from .instagram_executor import InstagramExecutor
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+_LISTED = object()
+
+
+class DirectFetcher:
+    """Постраничная выборка сообщений Direct с учетом временной границы.
+
+    Треды запрашиваются страницами в порядке последней активности, поэтому
+    листание прекращается на первом треде старше границы. Сообщения тредов
+    загружаются параллельно (не больше concurrency одновременно), и каждый
+    тред пролистывается только до cutoff.
+
+    Client instagrapi не потокобезопасен (last_json, last_response общие),
+    поэтому вызовы через клиент из пула выполняются строго по одному, а
+    параллельные загрузки тредов идут через копии клиента из get_settings().
+    """
+
+    def __init__(
+            self,
+            executor: InstagramExecutor,
+            concurrency: Optional[int] = None,
+            message_page_size: Optional[int] = None
+    ):
+        self.executor = executor
+        self.concurrency = concurrency or int(os.getenv("INSTAGRAM_FETCH_CONCURRENCY", executor.per_user_limit))
+        self.message_page_size = message_page_size or int(os.getenv("INSTAGRAM_MESSAGE_PAGE_SIZE", "20"))
+        self._client_locks: "weakref.WeakKeyDictionary[Client, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+    def _client_lock(self, client: Client) -> asyncio.Lock:
+        lock = self._client_locks.get(client)
+        if lock is None:
+            lock = self._client_locks[client] = asyncio.Lock()
+        return lock
+
+    @staticmethod
+    def _clone(client: Client) -> Client:
+        """Отдельный клиент с той же сессией и прокси для параллельных запросов"""
+        return type(client)(
+            settings=client.get_settings(),
+            proxy=getattr(client, "proxy", None),
+            request_timeout=getattr(client, "request_timeout", 20)
+        )
+
+    async def fetch(
+            self,
+            user_id: int,
+            client: Client,
+            cutoff: float,
+            thread_cutoffs: Optional[Dict[str, float]] = None
+    ) -> List[Dict]:
+        """Все сообщения новее cutoff (unix timestamp)"""
+        messages = []
+        async for batch, _ in self.stream(user_id, client, cutoff, thread_cutoffs):
+            messages.extend(batch)
+        return messages
+
+    async def stream(
+            self,
+            user_id: int,
+            client: Client,
+            cutoff: float,
+            thread_cutoffs: Optional[Dict[str, float]] = None
+    ) -> AsyncIterator[Tuple[List[Dict], float]]:
+        """Выдача сообщений пачками по тредам по мере загрузки.
+
+        cutoff ограничивает листание инбокса, thread_cutoffs позволяет задать
+        для отдельных тредов более позднюю границу (курсор синхронизации).
+        Вместе с пачкой выдается watermark: все сообщения новее него уже
+        выданы, поэтому их порядок в отчете окончателен.
+        """
+        thread_cutoffs = thread_cutoffs or {}
+        results: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        # Последняя активность тредов, сообщения которых еще не выданы
+        pending: Dict[str, float] = {}
+        # Верхняя граница активности тредов, до которых листание еще не дошло
+        unlisted = [math.inf]
+        # Копии клиента, свободные для загрузки очередного треда
+        workers: List[Client] = []
+
+        async def fetch_thread(thread: DirectThread):
+            worker = None
+            try:
+                if workers:
+                    worker = workers.pop()
+                else:
+                    async with self._client_lock(client):
+                        worker = self._clone(client)
+                batch = await self._thread_messages(
+                    user_id,
+                    worker,
+                    thread,
+                    max(cutoff, thread_cutoffs.get(thread.id, cutoff))
+                )
+                workers.append(worker)
+                await results.put((thread.id, batch))
+            except Exception as e:
+                # После тайм-аута запрос еще может выполняться в потоке: копию не переиспользуем
+                await results.put(e)
+            finally:
+                slots.release()
+
+        async def produce():
+            try:
+                async for thread in self._iter_threads(user_id, client, cutoff):
+                    last_activity = thread.last_activity_at.timestamp()
+                    pending[thread.id] = last_activity
+                    if not thread.is_pin:
+                        unlisted[0] = min(unlisted[0], last_activity)
+                    await slots.acquire()
+                    task = asyncio.create_task(fetch_thread(thread))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await results.put(_LISTED)
+                if tasks:
+                    await asyncio.gather(*tasks)
+                await results.put(_DONE)
+            except Exception as e:
+                await results.put(e)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await results.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                if item is _LISTED:
+                    unlisted[0] = -math.inf
+                    batch = []
+                else:
+                    thread_id, batch = item
+                    pending.pop(thread_id, None)
+                yield batch, max(max(pending.values(), default=-math.inf), unlisted[0])
+        finally:
+            producer.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    async def _iter_threads(self, user_id: int, client: Client, cutoff: float) -> AsyncIterator[DirectThread]:
+        cursor = None
+        while True:
+            async with self._client_lock(client):
+                threads, cursor = await self.executor.run(
+                    user_id,
+                    client.direct_threads_chunk,
+                    thread_message_limit=self.message_page_size,
+                    cursor=cursor
+                )
+            for thread in threads:
+                if thread.last_activity_at.timestamp() >= cutoff:
+                    yield thread
+                elif not thread.is_pin:
+                    # Инбокс отсортирован по активности: дальше только старые треды
+                    return
+            if not cursor or not threads:
+                return
+
+    async def _thread_messages(self, user_id: int, client: Client, thread: DirectThread, cutoff: float) -> List[Dict]:
+        """Сообщения треда новее cutoff. Каждая страница - отдельный вызов в пуле потоков"""
+        messages = []
+        seen = set()
+        # Инбокс уже содержит первую страницу сообщений треда
+        for msg in thread.messages:
+            if msg.timestamp.timestamp() < cutoff:
+                return messages
+            seen.add(msg.id)
+            messages.append(self._to_dict(thread, msg))
+        if len(thread.messages) < self.message_page_size:
+            return messages
+
+        # Продолжаем со следующей страницы: курсор треда - id самого старого полученного сообщения
+        params = {
+            "visual_message_return_type": "unseen",
+            "direction": "older",
+            "seq_id": "40065",
+            "limit": str(self.message_page_size),
+            "cursor": thread.messages[-1].id,
+        }
+        while True:
+            result = await self.executor.run(
+                user_id,
+                client.private_request,
+                f"direct_v2/threads/{thread.id}/",
+                params=dict(params)
+            )
+            page = result["thread"]
+            for item in page["items"]:
+                msg = extract_direct_message(item)
+                if msg.timestamp.timestamp() < cutoff:
+                    return messages
+                if msg.id in seen:
+                    continue
+                seen.add(msg.id)
+                messages.append(self._to_dict(thread, msg))
+            cursor = page.get("oldest_cursor")
+            if not cursor or not page.get("has_older"):
+                return messages
+            params["cursor"] = cursor
+
+    @staticmethod
+    def _to_dict(thread: DirectThread, msg) -> Dict:
+        return {
+            'id': msg.id,
+            'thread_id': thread.id,
+            'user': thread.users[0].username if thread.users else thread.thread_title,
+            'text': msg.text or f"[{msg.item_type}]",
+            'timestamp': msg.timestamp.timestamp()
+        }
@@ -1,13 +1,13 @@
 # src/instagram_service.py
+import asyncio
 import logging
 import os
 import json
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from pathlib import Path
 from instagrapi import Client
 from cryptography.fernet import Fernet
-import ssl
 from aiogram.filters import Command
 
 from aiogram import Bot, Dispatcher, types
@@ -15,8 +15,15 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 
-from .utils import get_user_data, update_user_data, fernet, storage
+from .utils import get_user_data, get_user_fields, update_user_data, fernet, storage
 from .vpn_manager import VPNManager  # Добавляем интеграцию с VPN
+from .instagram_executor import InstagramExecutor
+from .instagram_fetcher import DirectFetcher
+from .instagram_client_pool import InstagramClientPool
+from .proxy_pool import ProxyPool, normalize_proxy
+from .instagram_sync import DirectSync
+from .report_stream import ReportStream
+from .rate_limiter import bulk_sends
 
 logger = logging.getLogger(__name__)
 from instagrapi.exceptions import (
@@ -54,47 +61,66 @@ class InstagramService:
         TIME_RANGE_INPUT = State()
         PROCESSING = State()
 
-    def __init__(self, bot: Bot, dp: Dispatcher):
+    def __init__(self, bot: Bot, dp: Dispatcher, vpn: Optional[VPNManager] = None):
         self.bot = bot
         self.dp = dp
-        self.vpn = VPNManager()
+        self.vpn = vpn or VPNManager()
         self.states = self.InstagramStates()
-        self.ssl_ctx = ssl.create_default_context()
-        self.ssl_ctx.set_ciphers('DEFAULT@SECLEVEL=1')
+        self.proxies = ProxyPool()
+        self.executor = InstagramExecutor(on_result=self.proxies.observe)
+        self.fetcher = DirectFetcher(self.executor)
+        self.clients = InstagramClientPool(self.load_session, self.save_session)
+        self.sync = None
+        if os.getenv("INSTAGRAM_INCREMENTAL_SYNC", "True") == "True":
+            self.sync = DirectSync(self.fetcher)
         self.setup_handlers()
-        self._init_vpn()
-
-    def _init_vpn(self):
-        if os.getenv("VPN_REQUIRED", "True") == "True":
-            result = self.vpn.start()
-            logger.info(result)
 
     async def get_client(self, user_id: int) -> Client:
-        """Создание клиента с учетом прокси и SSL"""
-        # Получение пользовательского прокси
-        cl = Client(
-            proxy=await self._get_user_proxy(user_id),
-            ssl_context=self.ssl_ctx,
-            timeout=20
+        """Авторизованный клиент пользователя из пула"""
+        client = await self.clients.get(user_id)
+        current = getattr(client, "proxy", None)
+        if current and not self.proxies.healthy(current):
+            # Прокси теплого клиента деградировал - переключаем без новой авторизации
+            proxy = self.proxies.pick(await self._get_user_proxy(user_id))
+            # Без замены остаемся на текущем: set_proxy(None) не сбрасывает client.proxy,
+            # и пул учитывал бы запросы без прокси на счет старого
+            if proxy and proxy != current:
+                client.set_proxy(proxy)
+        return client
+
+    async def new_client(self, user_id: int, settings: Optional[dict] = None) -> Client:
+        """Создание клиента с учетом прокси"""
+        # Прокси пользователя, если он здоров, иначе лучший из общего пула
+        return self._build_client(settings, self.proxies.pick(await self._get_user_proxy(user_id)))
+
+    @staticmethod
+    def _build_client(settings: Optional[dict], proxy: Optional[str]) -> Client:
+        return Client(
+            settings=settings or {},
+            proxy=proxy,
+            request_timeout=20
         )
-        return cl
-
-    async def _get_user_proxy(self, user_id: int) -> Optional[str]:  # Возвращаем строку
-        encrypted = await storage.redis.get(f"proxy:{user_id}")
-        if encrypted:
-            return self.fernet.decrypt(encrypted).decode()
-        return None
 
-    def __init__(self, bot: Bot, dp: Dispatcher):
-        self.bot = bot
-        self.dp = dp
-        self.states = self.InstagramStates()
-        self.setup_handlers()
+    async def _get_user_proxy(self, user_id: int, stored: Optional[bytes] = None) -> Optional[str]:  # Возвращаем строку
+        if stored is None:
+            stored = await get_user_data(user_id, "proxy")
+        if not stored:
+            # Прокси, сохраненные до переноса в user:{id}
+            encrypted = await storage.redis.get(f"proxy:{user_id}")
+            stored = fernet.decrypt(encrypted) if encrypted else None
+        if not stored:
+            return None
+        # Сохраненные до проверки формата адреса приводим к виду схема://хост:порт
+        try:
+            return normalize_proxy(stored.decode())
+        except ValueError as e:
+            logger.warning(f"Прокси пользователя {user_id} не используется: {str(e)}")
+            return None
 
     def setup_handlers(self):
         self.dp.message.register(
             self.handle_instagram_start,
-            Command("instagram")
+            Command("instagram", "instagram_auth")
         )
         self.dp.message.register(
             self.handle_credentials_input,
@@ -132,12 +158,12 @@ class InstagramService:
     async def instagram_auth(self, user_id: int, state: FSMContext):
         data = await state.get_data()
         credentials = data['credentials']
-        cl = Client()
+        cl = await self.new_client(user_id)
 
         try:
             await self.bot.send_message(user_id, "🔐 Пытаюсь войти в аккаунт...")
-            cl.login(credentials['login'], credentials['password'])
-            await self.save_session(user_id, cl)
+            await self.executor.run(user_id, cl.login, credentials['login'], credentials['password'])
+            await self.on_login(user_id, cl)
             await self.bot.send_message(user_id, "✅ Успешная авторизация!")
             await self.request_time_range(user_id, state)
 
@@ -148,7 +174,7 @@ class InstagramService:
                 "🔑 Введите код двухфакторной аутентификации:"
             )
 
-        except (LoginRequired, ChallengeRequired, ClientError) as e:
+        except (LoginRequired, ChallengeRequired, ClientError, asyncio.TimeoutError) as e:
             await self.handle_auth_error(user_id, e)
             await state.clear()
 
@@ -156,15 +182,17 @@ class InstagramService:
         user_id = message.from_user.id  # Добавляем получение user_id
         data = await state.get_data()
         credentials = data['credentials']
-        cl = Client()
+        cl = await self.new_client(user_id)
 
         try:
-            cl.login(
+            await self.executor.run(
+                user_id,
+                cl.login,
                 credentials['login'],
                 credentials['password'],
                 verification_code=message.text.strip()
             )
-            await self.save_session(user_id, cl)  # Теперь user_id определен
+            await self.on_login(user_id, cl)
             await self.bot.send_message(user_id, "✅ Успешная авторизация!")
             await self.request_time_range(user_id, state)
 
@@ -172,10 +200,16 @@ class InstagramService:
             await self.handle_auth_error(user_id, e)  # Используем полученный user_id
             await state.clear()
 
+    async def on_login(self, user_id: int, client: Client):
+        """Сохранение нового клиента и сброс кэша сообщений прежнего аккаунта"""
+        await self.clients.put(user_id, client)
+        if self.sync:
+            await self.sync.reset(user_id)
+
     async def save_session(self, user_id: int, client: Client):
         session_data = client.get_settings()
-        encrypted = fernet.encrypt(json.dumps(session_data).encode())
-        await update_user_data(user_id, {"instagram_session": encrypted.decode()})
+        # Шифрование и сжатие - в update_user_data
+        await update_user_data(user_id, "instagram_session", json.dumps(session_data, separators=(",", ":")))
 
     async def request_time_range(self, user_id: int, state: FSMContext):
         await self.bot.send_message(
@@ -198,17 +232,18 @@ class InstagramService:
 
     async def process_instagram_data(self, user_id: int, state: FSMContext):
         try:
-            if not self.vpn.is_active():
-                self._init_vpn()
+            if self.vpn.required and not self.vpn.is_active():
+                # Переподключением занимается фоновая проба VPNManager
+                self.vpn.request_check()
             data = await state.get_data()
             hours = data['hours']
-            cl = await self.load_session(user_id)
+            cl = await self.get_client(user_id)
 
             await self.bot.send_message(user_id, "⏳ Собираю сообщения...")
-            messages = await self.get_recent_messages(cl, hours)
-
-            report = self.generate_report(messages)
-            await self.send_report(user_id, report)
+            try:
+                await self.send_report(user_id, cl, hours)
+            finally:
+                await self.clients.release(user_id)
 
         except Exception as e:
             await self.handle_processing_error(user_id, e)
@@ -216,53 +251,47 @@ class InstagramService:
             await state.clear()
 
     async def load_session(self, user_id: int) -> Client:
-        encrypted = await get_user_data(user_id, "instagram_session")
-        if not encrypted:
+        # Сессия и прокси - одним HMGET
+        fields = await get_user_fields(user_id, "instagram_session", "proxy")
+        session = fields["instagram_session"]
+        if not session:
             raise ValueError("Сессия не найдена")
 
-        session_data = json.loads(fernet.decrypt(encrypted.encode()).decode())
-        cl = Client()
-        cl.set_settings(session_data)
-        return cl
-
-    async def get_recent_messages(self, client: Client, hours: int) -> List[Dict]:
-        threads = client.direct_threads()
-        cutoff = datetime.now() - timedelta(hours=hours)
-
-        messages = []
-        for thread in threads:
-            for msg in client.direct_messages(thread.id):
-                if msg.timestamp >= cutoff.timestamp():
-                    messages.append({
-                        'user': thread.users[0].username,
-                        'text': msg.text,
-                        'timestamp': msg.timestamp
-                    })
-        return messages
-
-    def generate_report(self, messages: List[Dict]) -> str:
-        if not messages:
-            return "📭 Нет сообщений за выбранный период"
-
-        report = ["📨 Последние сообщения:"]
-        for msg in sorted(messages, key=lambda x: x['timestamp'], reverse=True)[:50]:
-            dt = datetime.fromtimestamp(msg['timestamp'])
-            report.append(
-                f"{dt.strftime('%d.%m.%Y %H:%M')} "
-                f"@{msg['user']}: {msg['text'][:100]}"
-            )
-        return "\n".join(report)
-
-    async def send_report(self, user_id: int, report: str):
-        chunks = [report[i:i + 4000] for i in range(0, len(report), 4000)]
-        for chunk in chunks:
-            await self.bot.send_message(user_id, chunk)
+        session_data = json.loads(session)
+        proxy = self.proxies.pick(await self._get_user_proxy(user_id, fields["proxy"]))
+        return self._build_client(session_data, proxy)
+
+    async def stream_recent_messages(
+            self,
+            user_id: int,
+            client: Client,
+            hours: int,
+            limit: Optional[int] = None
+    ) -> AsyncIterator[Tuple[List[Dict], float]]:
+        """Пачки сообщений за последние hours часов с watermark источника"""
+        cutoff = (datetime.now() - timedelta(hours=hours)).timestamp()
+        if self.sync:
+            source = self.sync.stream(user_id, client, cutoff, limit)
+        else:
+            source = self.fetcher.stream(user_id, client, cutoff)
+        async for batch, watermark in source:
+            yield batch, watermark
+
+    async def send_report(self, user_id: int, client: Client, hours: int):
+        # Части отчета уступают очередь отправки интерактивным ответам
+        with bulk_sends():
+            report = ReportStream(lambda chunk: self.bot.send_message(user_id, chunk))
+            async for batch, watermark in self.stream_recent_messages(user_id, client, hours, report.limit):
+                report.add(batch)
+                await report.advance(watermark)
+            await report.close()
 
     async def handle_auth_error(self, user_id: int, error: Exception):
         error_msg = {
             LoginRequired: "❌ Ошибка авторизации: Неверные учетные данные",
             ChallengeRequired: "🔒 Требуется проверка в приложении Instagram",
-            ClientError: f"🚫 Ошибка клиента: {str(error)}"
+            ClientError: f"🚫 Ошибка клиента: {str(error)}",
+            asyncio.TimeoutError: "⌛ Instagram не ответил вовремя, попробуйте позже"
         }.get(type(error), f"⚠️ Неизвестная ошибка: {str(error)}")
 
         await self.bot.send_message(user_id, error_msg)
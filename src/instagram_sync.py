@@ -0,0 +1,173 @@
+# src/instagram_sync.py
+import json
+import logging
+import math
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from instagrapi import Client
+
+from .instagram_fetcher import DirectFetcher
+from .utils import fernet, storage
+
+logger = logging.getLogger(__name__)
+
+
+class DirectSync:
+    """Инкрементальная синхронизация Direct через Redis.
+
+    Для каждого треда хранится курсор (id и время последнего сообщения),
+    а сами сообщения - в скользящем окне (sorted set по времени + hash с
+    зашифрованными данными). Повторный запрос догружает только треды,
+    активные после прошлой синхронизации, и только сообщения новее курсора.
+
+    Ключи Redis:
+        ig_sync:{user_id}     - covered_since, synced_at
+        ig_cursor:{user_id}   - thread_id -> {"id", "ts"}
+        ig_window:{user_id}   - "thread_id:msg_id" -> timestamp (zset)
+        ig_messages:{user_id} - "thread_id:msg_id" -> зашифрованный JSON
+    """
+
+    def __init__(
+            self,
+            fetcher: DirectFetcher,
+            retention_hours: Optional[int] = None,
+            clock_skew: Optional[float] = None
+    ):
+        self.fetcher = fetcher
+        self.retention = (retention_hours or int(os.getenv("INSTAGRAM_SYNC_RETENTION_HOURS", "168"))) * 3600
+        self.clock_skew = clock_skew or float(os.getenv("INSTAGRAM_SYNC_SKEW", "60"))
+
+    @staticmethod
+    def _keys(user_id: int) -> Dict[str, str]:
+        return {
+            "sync": f"ig_sync:{user_id}",
+            "cursor": f"ig_cursor:{user_id}",
+            "window": f"ig_window:{user_id}",
+            "messages": f"ig_messages:{user_id}",
+        }
+
+    async def window(self, user_id: int, client: Client, cutoff: float) -> List[Dict]:
+        """Синхронизация и выдача сообщений окна новее cutoff"""
+        messages = []
+        async for batch, _ in self.stream(user_id, client, cutoff):
+            messages.extend(batch)
+        return messages
+
+    async def stream(
+            self,
+            user_id: int,
+            client: Client,
+            cutoff: float,
+            limit: Optional[int] = None
+    ) -> AsyncIterator[Tuple[List[Dict], float]]:
+        """Синхронизация с выдачей сообщений окна по мере готовности.
+
+        Полная выборка отдается пачками прямо из DirectFetcher.stream,
+        инкрементальная - одной пачкой из кэша (не больше limit новейших).
+        """
+        keys = self._keys(user_id)
+        redis = storage.redis
+        started_at = time.time()
+        cutoff = max(cutoff, started_at - self.retention)
+
+        meta = await redis.hgetall(keys["sync"])
+        covered_since = float(meta[b"covered_since"]) if b"covered_since" in meta else None
+        synced_at = float(meta[b"synced_at"]) if b"synced_at" in meta else None
+
+        if covered_since is None or synced_at is None or cutoff < covered_since:
+            # Окно не покрывает запрошенный диапазон - полная выборка
+            await redis.delete(*keys.values())
+            cursors = {}
+            async for batch, watermark in self.fetcher.stream(user_id, client, cutoff):
+                await self._store(user_id, batch, cursors)
+                yield batch, watermark
+            await self._finish(user_id, started_at, cutoff, cursors)
+            return
+
+        cursors = {
+            thread_id.decode(): json.loads(value)
+            for thread_id, value in (await redis.hgetall(keys["cursor"])).items()
+        }
+        messages = await self.fetcher.fetch(
+            user_id,
+            client,
+            synced_at - self.clock_skew,
+            {thread_id: cursor["ts"] for thread_id, cursor in cursors.items()}
+        )
+        logger.info(f"Инкрементальная синхронизация {user_id}: {len(messages)} новых сообщений")
+        await self._store(user_id, messages, cursors)
+        await self._finish(user_id, started_at, covered_since, cursors)
+        yield await self.read(user_id, cutoff, limit), -math.inf
+
+    async def read(self, user_id: int, cutoff: float, limit: Optional[int] = None) -> List[Dict]:
+        """Сообщения из кэшированного окна новее cutoff (от новых к старым)"""
+        keys = self._keys(user_id)
+        members = await storage.redis.zrevrangebyscore(
+            keys["window"], "+inf", cutoff,
+            start=0 if limit else None,
+            num=limit
+        )
+        if not members:
+            return []
+        payloads = await storage.redis.hmget(keys["messages"], members)
+        return [
+            json.loads(fernet.decrypt(payload))
+            for payload in payloads
+            if payload
+        ]
+
+    async def _finish(self, user_id: int, started_at: float, covered_since: float, cursors: Dict[str, Dict]):
+        floor = started_at - self.retention
+        await self._trim(user_id, floor, cursors)
+        await storage.redis.hset(self._keys(user_id)["sync"], mapping={
+            "covered_since": max(covered_since, floor),
+            "synced_at": started_at,
+        })
+
+    async def reset(self, user_id: int):
+        """Сброс состояния синхронизации (например, после входа в другой аккаунт)"""
+        await storage.redis.delete(*self._keys(user_id).values())
+
+    async def _store(self, user_id: int, messages: List[Dict], cursors: Dict[str, Dict]):
+        if not messages:
+            return
+        keys = self._keys(user_id)
+        scores, payloads, changed = {}, {}, {}
+        for msg in messages:
+            member = f"{msg['thread_id']}:{msg['id']}"
+            scores[member] = msg['timestamp']
+            payloads[member] = fernet.encrypt(json.dumps(msg).encode())
+            cursor = cursors.get(msg['thread_id'])
+            if not cursor or msg['timestamp'] > cursor["ts"]:
+                cursors[msg['thread_id']] = changed[msg['thread_id']] = {
+                    "id": msg['id'],
+                    "ts": msg['timestamp']
+                }
+
+        pipe = storage.redis.pipeline(transaction=False)
+        pipe.zadd(keys["window"], scores)
+        pipe.hset(keys["messages"], mapping=payloads)
+        # Повторная выборка внутри clock_skew может не сдвинуть ни один курсор,
+        # а hset с пустым mapping в redis-py падает с DataError
+        if changed:
+            pipe.hset(keys["cursor"], mapping={
+                thread_id: json.dumps(cursor) for thread_id, cursor in changed.items()
+            })
+        await pipe.execute()
+
+    async def _trim(self, user_id: int, floor: float, cursors: Dict[str, Dict]):
+        keys = self._keys(user_id)
+        expired = await storage.redis.zrangebyscore(keys["window"], "-inf", f"({floor}")
+        stale = [thread_id for thread_id, cursor in cursors.items() if cursor["ts"] < floor]
+        if not expired and not stale:
+            return
+
+        pipe = storage.redis.pipeline(transaction=False)
+        if expired:
+            pipe.zremrangebyscore(keys["window"], "-inf", f"({floor}")
+            pipe.hdel(keys["messages"], *expired)
+        if stale:
+            pipe.hdel(keys["cursor"], *stale)
+        await pipe.execute()
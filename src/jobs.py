@@ -0,0 +1,303 @@
+# src/jobs.py
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+
+from .metrics import JOB_SECONDS
+from .utils import storage
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "jobs:pending"
+PROCESSING_KEY = "jobs:processing"
+ACTIVE_KEY = "jobs:active"
+DELAYED_KEY = "jobs:delayed"
+
+# Сначала переносим в очередь отложенные повторы, время которых пришло.
+# Затем забираем первую задачу, пользователь которой не превысил лимит.
+# Задачи пользователей на лимите возвращаются в конец очереди.
+CLAIM_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[4], 'LIMIT', 0, tonumber(ARGV[3]))
+for _, id in ipairs(due) do
+    redis.call('ZREM', KEYS[4], id)
+    redis.call('LPUSH', KEYS[1], id)
+end
+local scan = math.min(redis.call('LLEN', KEYS[1]), tonumber(ARGV[3]))
+for i = 1, scan do
+    local id = redis.call('RPOP', KEYS[1])
+    if not id then
+        return false
+    end
+    local job_key = 'job:' .. id
+    local user = redis.call('HGET', job_key, 'user_id')
+    if not user then
+        -- задача удалена, пропускаем
+    elseif tonumber(redis.call('HGET', KEYS[3], user) or '0') < tonumber(ARGV[2]) then
+        redis.call('HINCRBY', KEYS[3], user, 1)
+        redis.call('ZADD', KEYS[2], ARGV[1], id)
+        redis.call('HINCRBY', job_key, 'attempts', 1)
+        redis.call('HSET', job_key, 'status', 'running')
+        return id
+    else
+        redis.call('LPUSH', KEYS[1], id)
+    end
+end
+return false
+"""
+
+# Завершение задачи: только если она все еще числится за воркером
+FINISH_SCRIPT = """
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 0 then
+    return 0
+end
+local job_key = 'job:' .. ARGV[1]
+local user = redis.call('HGET', job_key, 'user_id')
+if user and tonumber(redis.call('HINCRBY', KEYS[3], user, -1)) <= 0 then
+    redis.call('HDEL', KEYS[3], user)
+end
+redis.call('HSET', job_key, 'status', ARGV[2], 'result', ARGV[3])
+if ARGV[2] == 'queued' and tonumber(ARGV[5]) > 0 then
+    redis.call('ZADD', KEYS[4], ARGV[5], ARGV[1])
+elseif ARGV[2] == 'queued' then
+    redis.call('LPUSH', KEYS[1], ARGV[1])
+else
+    redis.call('EXPIRE', job_key, tonumber(ARGV[4]))
+end
+return 1
+"""
+
+
+class PermanentJobError(Exception):
+    """Ошибка, которую повтор не исправит: задача сразу завершается неудачей"""
+
+
+class Job:
+    """Задача рендера или загрузки"""
+
+    def __init__(self, job_id: str, data: Dict[bytes, bytes]):
+        self.id = job_id
+        self.type = data[b"type"].decode()
+        self.user_id = int(data[b"user_id"])
+        self.chat_id = int(data[b"chat_id"])
+        self.payload = json.loads(data[b"payload"])
+        self.attempts = int(data.get(b"attempts", 0))
+        self.max_attempts = int(data[b"max_attempts"])
+
+    @property
+    def is_last_attempt(self) -> bool:
+        return self.attempts >= self.max_attempts
+
+
+class JobQueue:
+    """Очередь задач в Redis с тайм-аутом видимости и повторами.
+
+    Повтор после ошибки откладывается экспоненциально: retry_delay,
+    удвоенный на каждую попытку, но не больше retry_max_delay.
+
+    Ключи Redis:
+        jobs:pending    - список id задач в ожидании (LPUSH / RPOP)
+        jobs:delayed    - id -> время, когда повтор можно забрать (zset)
+        jobs:processing - id -> дедлайн видимости (zset)
+        jobs:active     - user_id -> число выполняемых задач
+        job:{id}        - данные и статус задачи
+    """
+
+    def __init__(
+            self,
+            visibility_timeout: Optional[float] = None,
+            max_attempts: Optional[int] = None,
+            per_user_limit: Optional[int] = None
+    ):
+        self.visibility_timeout = visibility_timeout or float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.per_user_limit = per_user_limit or int(os.getenv("JOB_USER_LIMIT", "1"))
+        self.result_ttl = int(os.getenv("JOB_RESULT_TTL", "86400"))
+        self.retry_delay = float(os.getenv("JOB_RETRY_DELAY", "30"))
+        self.retry_max_delay = float(os.getenv("JOB_RETRY_MAX_DELAY", "900"))
+        self.handlers: Dict[str, Callable[[Job], Awaitable[Any]]] = {}
+        self._claim = storage.redis.register_script(CLAIM_SCRIPT)
+        self._finish = storage.redis.register_script(FINISH_SCRIPT)
+
+    def register(self, job_type: str, handler: Callable[[Job], Awaitable[Any]]):
+        self.handlers[job_type] = handler
+
+    async def enqueue(self, job_type: str, user_id: int, chat_id: int, payload: Dict) -> str:
+        job_id = uuid.uuid4().hex
+        pipe = storage.redis.pipeline(transaction=True)
+        pipe.hset(f"job:{job_id}", mapping={
+            "type": job_type,
+            "user_id": user_id,
+            "chat_id": chat_id,
+            "payload": json.dumps(payload),
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "status": "queued",
+            "created_at": time.time(),
+        })
+        pipe.lpush(PENDING_KEY, job_id)
+        await pipe.execute()
+        return job_id
+
+    async def claim(self, scan_limit: int = 50) -> Optional[Job]:
+        job_id = await self._claim(
+            keys=[PENDING_KEY, PROCESSING_KEY, ACTIVE_KEY, DELAYED_KEY],
+            args=[time.time() + self.visibility_timeout, self.per_user_limit, scan_limit, time.time()]
+        )
+        if not job_id:
+            return None
+        job_id = job_id.decode()
+        return Job(job_id, await storage.redis.hgetall(f"job:{job_id}"))
+
+    async def heartbeat(self, job: Job):
+        """Продление видимости выполняемой задачи"""
+        await storage.redis.zadd(
+            PROCESSING_KEY,
+            {job.id: time.time() + self.visibility_timeout},
+            xx=True
+        )
+
+    async def complete(self, job: Job, result: Any = None) -> bool:
+        return await self._finish_job(job.id, "done", json.dumps(result))
+
+    async def fail(self, job: Job, error: str, retry: bool = True) -> bool:
+        """Отложенный повтор задачи или окончательная ошибка. True - будет повтор"""
+        status = "queued" if retry and not job.is_last_attempt else "failed"
+        await self._finish_job(job.id, status, json.dumps(error), self.backoff(job.attempts))
+        return status == "queued"
+
+    def backoff(self, attempts: int) -> float:
+        """Задержка повтора после attempts неудачных попыток"""
+        return min(self.retry_delay * 2 ** max(attempts - 1, 0), self.retry_max_delay)
+
+    async def requeue_expired(self) -> List[str]:
+        """Возврат в очередь задач, чьи воркеры перестали отвечать"""
+        expired = await storage.redis.zrangebyscore(PROCESSING_KEY, "-inf", time.time())
+        requeued = []
+        for job_id in expired:
+            job_id = job_id.decode()
+            data = await storage.redis.hmget(f"job:{job_id}", "attempts", "max_attempts")
+            attempts, max_attempts = (int(value or 0) for value in data)
+            status = "failed" if attempts >= max_attempts else "queued"
+            if await self._finish_job(job_id, status, json.dumps("visibility timeout")):
+                logger.warning(f"Задача {job_id} просрочена, статус: {status}")
+                requeued.append(job_id)
+        return requeued
+
+    async def status(self, job_id: str) -> Optional[str]:
+        value = await storage.redis.hget(f"job:{job_id}", "status")
+        return value.decode() if value else None
+
+    async def depth(self) -> int:
+        """Задачи в ожидании, включая отложенные повторы"""
+        return await storage.redis.llen(PENDING_KEY) + await storage.redis.zcard(DELAYED_KEY)
+
+    async def _finish_job(self, job_id: str, status: str, result: str, delay: float = 0) -> bool:
+        return bool(await self._finish(
+            keys=[PENDING_KEY, PROCESSING_KEY, ACTIVE_KEY, DELAYED_KEY],
+            args=[job_id, status, result, self.result_ttl, time.time() + delay if delay else 0]
+        ))
+
+
+class JobWorkerPool:
+    """Пул асинхронных воркеров очереди задач.
+
+    Число воркеров - глобальный лимит одновременно выполняемых задач.
+    Пул можно запускать внутри бота или отдельным процессом (src/worker.py).
+    """
+
+    def __init__(
+            self,
+            queue: JobQueue,
+            bot: Bot,
+            concurrency: Optional[int] = None,
+            poll_interval: Optional[float] = None
+    ):
+        self.queue = queue
+        self.bot = bot
+        self.concurrency = concurrency or int(os.getenv("JOB_WORKERS", "2"))
+        self.poll_interval = poll_interval or float(os.getenv("JOB_POLL_INTERVAL", "1"))
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"job-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._reaper(), name="job-reaper"))
+        logger.info(f"Запущено воркеров очереди: {self.concurrency}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                job = await self.queue.claim()
+            except Exception as e:
+                logger.error(f"Ошибка получения задачи: {str(e)}")
+                job = None
+            if not job:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job):
+        handler = self.queue.handlers.get(job.type)
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        started_at = time.monotonic()
+        status = "cancelled"
+        try:
+            if not handler:
+                raise ValueError(f"Неизвестный тип задачи: {job.type}")
+            result = await handler(job)
+            await self.queue.complete(job, result)
+            status = "done"
+        except asyncio.CancelledError:
+            # Остановка воркера: задача вернется в очередь по тайм-ауту видимости
+            raise
+        except Exception as e:
+            logger.error(f"Задача {job.id} ({job.type}) завершилась ошибкой: {str(e)}")
+            if await self.queue.fail(job, str(e), retry=not isinstance(e, PermanentJobError)):
+                status = "retry"
+                await self._notify(
+                    job,
+                    f"🔁 Ошибка, повторная попытка ({job.attempts}/{job.max_attempts}) "
+                    f"через {self.queue.backoff(job.attempts):.0f} сек."
+                )
+            else:
+                status = "failed"
+                await self._notify(job, f"❌ Задача не выполнена: {str(e)}")
+        finally:
+            heartbeat.cancel()
+            JOB_SECONDS.labels(type=job.type, status=status).observe(time.monotonic() - started_at)
+
+    async def _heartbeat(self, job: Job):
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 3)
+            try:
+                await self.queue.heartbeat(job)
+            except Exception as e:
+                logger.warning(f"Не удалось продлить задачу {job.id}: {str(e)}")
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 3)
+            try:
+                await self.queue.requeue_expired()
+            except Exception as e:
+                logger.error(f"Ошибка проверки просроченных задач: {str(e)}")
+
+    async def _notify(self, job: Job, text: str):
+        try:
+            await self.bot.send_message(job.chat_id, text)
+        except Exception as e:
+            logger.error(f"Не удалось отправить статус задачи {job.id}: {str(e)}")
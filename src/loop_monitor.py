@@ -0,0 +1,118 @@
+# src/loop_monitor.py
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from .metrics import LOOP_LAG, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """Контроль отзывчивости event loop.
+
+    Корутина-проба раз в interval измеряет задержку планирования (метрика
+    event_loop_lag_seconds). Поток-сторож следит за пробой: если loop не
+    отвечает дольше threshold, он снимает стек потока loop, имя текущей
+    задачи и обработчика. Когда loop оживает, блокировка пишется в лог
+    вместе с длительностью и снятым стеком.
+    """
+
+    def __init__(self, interval: Optional[float] = None, threshold: Optional[float] = None):
+        self.interval = interval or float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+        self.threshold = threshold or float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))
+        # Задача -> обработчик, который в ней выполняется
+        self.handlers: Dict[asyncio.Task, str] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._beat = time.monotonic()
+        self._stall: Optional[Dict[str, str]] = None
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._probe(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _probe(self):
+        while True:
+            started_at = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - started_at - self.interval, 0)
+            self._beat = now
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._report(lag)
+            else:
+                # Стек, снятый сторожем на короткой задержке, к блокировке не относится
+                self._stall = None
+
+    def _report(self, lag: float):
+        stall, self._stall = self._stall, None
+        if not stall:
+            logger.warning(f"Event loop заблокирован на {lag:.3f} сек. (стек не снят)")
+            LOOP_STALLS.labels(handler="unknown").inc()
+            return
+        LOOP_STALLS.labels(handler=stall["handler"]).inc()
+        logger.warning(
+            f"Event loop заблокирован на {lag:.3f} сек.: "
+            f"обработчик {stall['handler']}, задача {stall['task']}\n{stall['stack']}"
+        )
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            # Между ударами проба сама спит interval: задержкой считается только превышение
+            if self._stall or time.monotonic() - self._beat < self.threshold + self.interval:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self._loop)
+            self._stall = {
+                "stack": "".join(traceback.format_stack(frame)),
+                "task": task.get_name() if task else "callback",
+                "handler": self.handlers.get(task, "none") if task else "none",
+            }
+
+
+class HandlerTrackingMiddleware(BaseMiddleware):
+    """Запоминает, какой обработчик выполняется в текущей задаче"""
+
+    def __init__(self, monitor: LoopMonitor):
+        self.monitor = monitor
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        task = asyncio.current_task()
+        callback = getattr(data.get("handler"), "callback", None)
+        self.monitor.handlers[task] = getattr(callback, "__qualname__", "unknown")
+        try:
+            return await handler(event, data)
+        finally:
+            self.monitor.handlers.pop(task, None)
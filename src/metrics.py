@@ -0,0 +1,126 @@
+# src/metrics.py
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Сетка для быстрых операций (Redis, обработчики) и для долгих (API, рендер)
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время обработки обновления", ["handler", "state"], buckets=FAST_BUCKETS
+)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Ошибки обработчиков", ["handler", "error"])
+
+INSTAGRAM_SECONDS = Histogram(
+    "instagram_call_seconds", "Длительность вызовов instagrapi", ["method"], buckets=SLOW_BUCKETS
+)
+INSTAGRAM_ERRORS = Counter("instagram_call_errors_total", "Ошибки вызовов instagrapi", ["method", "error"])
+
+YOUTUBE_SECONDS = Histogram(
+    "youtube_call_seconds", "Длительность вызовов YouTube API", ["method"], buckets=SLOW_BUCKETS
+)
+YOUTUBE_ERRORS = Counter("youtube_call_errors_total", "Ошибки вызовов YouTube API", ["method", "error"])
+UPLOAD_BYTES = Counter("youtube_upload_bytes_total", "Байт отправлено в YouTube")
+
+RENDER_SECONDS = Histogram("render_seconds", "Длительность рендера видео", ["backend"], buckets=SLOW_BUCKETS)
+RENDER_CACHE = Counter("render_cache_total", "Обращения к кэшу рендера", ["result"])
+
+JOB_SECONDS = Histogram("job_seconds", "Длительность задач очереди", ["type", "status"], buckets=SLOW_BUCKETS)
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Задач в ожидании")
+
+REDIS_SECONDS = Histogram("redis_seconds", "Время round-trip к Redis", ["operation"], buckets=FAST_BUCKETS)
+
+USER_CACHE = Gauge("user_cache", "Кэш пользовательских данных", ["stat"])
+
+LOOP_LAG = Histogram("event_loop_lag_seconds", "Задержка планирования event loop", buckets=FAST_BUCKETS)
+LOOP_STALLS = Counter("event_loop_stalls_total", "Блокировки event loop дольше порога", ["handler"])
+
+PROXY_LATENCY = Gauge("proxy_latency_seconds", "EWMA задержки соединения с прокси", ["proxy", "kind"])
+PROXY_SUCCESS = Gauge("proxy_success_ratio", "EWMA доли успешных вызовов через прокси", ["proxy", "kind"])
+PROXY_COOLDOWN = Gauge("proxy_cooldown_seconds", "Остаток паузы прокси после challenge", ["proxy", "kind"])
+
+
+@contextmanager
+def track(histogram: Histogram, errors: Optional[Counter] = None, **labels):
+    """Замер длительности блока и подсчет ошибок по типу исключения"""
+    started_at = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if errors is not None:
+            errors.labels(**labels, error=type(e).__name__).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - started_at)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Латентность обработчиков в разрезе FSM-состояния"""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__qualname__", "unknown")
+        state = data.get("raw_state") or "none"
+        with track(HANDLER_SECONDS, HANDLER_ERRORS, handler=name, state=state):
+            return await handler(event, data)
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics внутри процесса бота и периодический сбор gauge.
+
+    Порт - METRICS_PORT; у бота и отдельного воркера на одном хосте он
+    должен различаться.
+    """
+
+    def __init__(
+            self,
+            queue: Any,
+            storage: Any,
+            user_cache: Any,
+            port: Optional[int] = None,
+            interval: Optional[float] = None
+    ):
+        self.queue = queue
+        self.storage = storage
+        self.user_cache = user_cache
+        self.port = port or int(os.getenv("METRICS_PORT", "8001"))
+        self.interval = interval or float(os.getenv("METRICS_INTERVAL", "15"))
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        start_http_server(self.port)
+        self._task = asyncio.create_task(self._collect(), name="metrics-collector")
+        logger.info(f"Метрики доступны на порту {self.port}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _collect(self):
+        while True:
+            try:
+                with track(REDIS_SECONDS, operation="ping"):
+                    await self.storage.redis.ping()
+                JOB_QUEUE_DEPTH.set(await self.queue.depth())
+                for stat, value in self.user_cache.stats().items():
+                    USER_CACHE.labels(stat=stat).set(value)
+            except Exception as e:
+                logger.warning(f"Ошибка сбора метрик: {str(e)}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,217 @@
+# src/proxy_pool.py
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from instagrapi.exceptions import (
+    ChallengeRequired,
+    ClientConnectionError,
+    ClientThrottledError,
+    PleaseWaitFewMinutes,
+    ProxyAddressIsBlocked
+)
+
+from .metrics import PROXY_COOLDOWN, PROXY_LATENCY, PROXY_SUCCESS
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых адрес прокси считается "засвеченным" в Instagram
+COOLDOWN_ERRORS = (ChallengeRequired, ProxyAddressIsBlocked, PleaseWaitFewMinutes, ClientThrottledError)
+# Ошибки самого прокси или сети
+FAILURE_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    ClientConnectionError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout
+)
+# Порты по умолчанию, как у requests/urllib3
+DEFAULT_PORTS = {"http": 80, "https": 443, "socks4": 1080, "socks4a": 1080, "socks5": 1080, "socks5h": 1080}
+
+
+def normalize_proxy(url: Optional[str]) -> Optional[str]:
+    """Прокси в виде схема://[логин:пароль@]хост:порт.
+
+    Как и instagrapi, адрес без схемы считается http://. Без порта
+    подставляется порт по умолчанию для схемы. Непригодный адрес - ValueError.
+    """
+    url = (url or "").strip()
+    if not url:
+        return None
+    if "://" not in url:
+        url = f"http://{url}"
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    # В тексте ошибки нет самого адреса: в нем может быть пароль
+    if scheme not in DEFAULT_PORTS:
+        raise ValueError(f"Неподдерживаемая схема прокси: {scheme}")
+    if not parts.hostname:
+        raise ValueError("В адресе прокси нет хоста")
+    port = parts.port or DEFAULT_PORTS[scheme]
+    auth = parts.netloc.rpartition("@")[0]
+    host = f"[{parts.hostname}]" if ":" in parts.hostname else parts.hostname
+    return f"{scheme}://{auth + '@' if auth else ''}{host}:{port}"
+
+
+class _ProxyStats:
+    __slots__ = ("url", "label", "shared", "latency", "success", "cooldown_until", "last_used")
+
+    def __init__(self, url: str, shared: bool, latency: float):
+        self.url = url
+        parts = urlsplit(url)
+        # В метках и логах - без логина и пароля
+        self.label = f"{parts.hostname}:{parts.port}"
+        self.shared = shared
+        self.latency = latency
+        self.success = 1.0
+        self.cooldown_until = 0.0
+        self.last_used = time.monotonic()
+
+
+class ProxyPool:
+    """Прокси для Instagram с оценкой здоровья.
+
+    Адреса ожидаются в виде normalize_proxy: со схемой и портом.
+
+    Для каждого прокси хранятся EWMA задержки (фоновая проба - TCP-соединение
+    с прокси раз в interval) и доля успешных вызовов (проба и реальные
+    вызовы instagrapi). После challenge или блокировки адреса прокси уходит
+    на cooldown. При выборе сначала берется прокси пользователя, если он
+    здоров, иначе лучший из общего пула (INSTAGRAM_PROXY, INSTAGRAM_PROXY_POOL).
+    """
+
+    def __init__(
+            self,
+            shared: Optional[List[str]] = None,
+            interval: Optional[float] = None,
+            timeout: Optional[float] = None,
+            cooldown: Optional[float] = None,
+            alpha: Optional[float] = None
+    ):
+        if shared is None:
+            shared = [os.getenv("INSTAGRAM_PROXY", "")] + os.getenv("INSTAGRAM_PROXY_POOL", "").split(",")
+        self.interval = interval or float(os.getenv("PROXY_PROBE_INTERVAL", "60"))
+        self.timeout = timeout or float(os.getenv("PROXY_PROBE_TIMEOUT", "5"))
+        self.cooldown = cooldown or float(os.getenv("PROXY_COOLDOWN", "1800"))
+        self.alpha = alpha or float(os.getenv("PROXY_EWMA_ALPHA", "0.3"))
+        self.min_success = float(os.getenv("PROXY_MIN_SUCCESS", "0.5"))
+        self.idle_ttl = float(os.getenv("PROXY_IDLE_TTL", "3600"))
+        self._proxies: Dict[str, _ProxyStats] = {}
+        for url in shared:
+            try:
+                url = normalize_proxy(url)
+            except ValueError as e:
+                logger.error(f"Прокси из общего пула пропущен: {str(e)}")
+                continue
+            if url:
+                self._track(url, shared=True)
+        self._task: Optional[asyncio.Task] = None
+
+    def _track(self, url: str, shared: bool = False) -> _ProxyStats:
+        stats = self._proxies.get(url)
+        if stats is None:
+            stats = self._proxies[url] = _ProxyStats(url, shared, self.timeout / 2)
+        stats.last_used = time.monotonic()
+        return stats
+
+    def healthy(self, url: str) -> bool:
+        stats = self._proxies.get(url)
+        if stats is None:
+            return True
+        return stats.cooldown_until <= time.monotonic() and stats.success >= self.min_success
+
+    def _score(self, stats: _ProxyStats) -> float:
+        return stats.success / max(stats.latency, 0.001)
+
+    def pick(self, pinned: Optional[str] = None) -> Optional[str]:
+        """Прокси для нового клиента: пользовательский, если здоров, иначе лучший общий"""
+        if pinned:
+            self._track(pinned)
+            if self.healthy(pinned):
+                return pinned
+        candidates = [stats for stats in self._proxies.values() if stats.shared and self.healthy(stats.url)]
+        if candidates:
+            best = max(candidates, key=self._score)
+            if pinned:
+                logger.info(f"Прокси {self._proxies[pinned].label} нездоров, используется {best.label}")
+            return best.url
+        # Здоровых нет - лучше плохой прокси пользователя, чем прямое соединение
+        return pinned
+
+    def observe(self, url: Optional[str], error: Optional[BaseException] = None):
+        """Итог вызова instagrapi через прокси url"""
+        if not url:
+            return
+        stats = self._track(url)
+        if isinstance(error, COOLDOWN_ERRORS):
+            stats.cooldown_until = time.monotonic() + self.cooldown
+            logger.warning(f"Прокси {stats.label} на паузе {self.cooldown:.0f} сек.: {type(error).__name__}")
+        elif error is None or not isinstance(error, FAILURE_ERRORS):
+            # Логические ошибки API не говорят о качестве прокси
+            self._update(stats, ok=True)
+        else:
+            self._update(stats, ok=False)
+
+    def _update(self, stats: _ProxyStats, ok: bool, latency: Optional[float] = None):
+        stats.success += self.alpha * ((1.0 if ok else 0.0) - stats.success)
+        if latency is not None:
+            stats.latency += self.alpha * (latency - stats.latency)
+
+    async def start(self):
+        if self._proxies:
+            logger.info(f"Общий пул прокси: {sum(stats.shared for stats in self._proxies.values())}")
+        self._task = asyncio.create_task(self._probe_loop(), name="proxy-probe")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _probe_loop(self):
+        while True:
+            try:
+                self._forget_idle()
+                await asyncio.gather(*(self._probe(stats) for stats in list(self._proxies.values())))
+                self._export()
+            except Exception as e:
+                logger.error(f"Ошибка проверки прокси: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def _probe(self, stats: _ProxyStats):
+        parts = urlsplit(stats.url)
+        started_at = time.monotonic()
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(parts.hostname, parts.port),
+                self.timeout
+            )
+            writer.close()
+            await writer.wait_closed()
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            logger.debug(f"Прокси {stats.label} недоступен: {str(e)}")
+            self._update(stats, ok=False, latency=self.timeout)
+            return
+        self._update(stats, ok=True, latency=time.monotonic() - started_at)
+
+    def _forget_idle(self):
+        deadline = time.monotonic() - self.idle_ttl
+        for url in [url for url, stats in self._proxies.items() if not stats.shared and stats.last_used < deadline]:
+            stats = self._proxies.pop(url)
+            for gauge in (PROXY_LATENCY, PROXY_SUCCESS, PROXY_COOLDOWN):
+                try:
+                    gauge.remove(stats.label, "pinned")
+                except KeyError:
+                    pass
+
+    def _export(self):
+        now = time.monotonic()
+        for stats in self._proxies.values():
+            kind = "shared" if stats.shared else "pinned"
+            PROXY_LATENCY.labels(proxy=stats.label, kind=kind).set(stats.latency)
+            PROXY_SUCCESS.labels(proxy=stats.label, kind=kind).set(stats.success)
+            PROXY_COOLDOWN.labels(proxy=stats.label, kind=kind).set(max(stats.cooldown_until - now, 0))
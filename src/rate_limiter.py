@@ -0,0 +1,171 @@
+# src/rate_limiter.py
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: меньше - раньше
+INTERACTIVE = 0
+BULK = 1
+
+send_priority: contextvars.ContextVar[int] = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_sends():
+    """Отправки внутри блока уступают очередь интерактивным ответам"""
+    token = send_priority.set(BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket с очередью ожидающих по приоритету"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return not self._waiters and self.tokens >= self.capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Токен уже выдан - возвращаем
+                self.tokens += 1
+            raise
+
+    def pause(self, seconds: float):
+        """Ни одного токена в ближайшие seconds секунд (ответ retry_after)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer or not self._waiters:
+            return
+        delay = max((1 - self.tokens) / self.rate, 0)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Ограничение исходящих запросов к Bot API.
+
+    Запросы с chat_id проходят через общий лимит бота и лимит чата,
+    ожидающие отправки упорядочены по приоритету (send_priority).
+    На TelegramRetryAfter чат ставится на паузу и запрос повторяется.
+    Запросы без chat_id (getUpdates, answerCallbackQuery, ...) не ограничиваются.
+    """
+
+    def __init__(
+            self,
+            global_rate: Optional[float] = None,
+            chat_rate: Optional[float] = None,
+            chat_burst: Optional[float] = None,
+            max_retries: Optional[int] = None
+    ):
+        global_rate = global_rate or float(os.getenv("SEND_GLOBAL_RATE", "30"))
+        self.chat_rate = chat_rate or float(os.getenv("SEND_CHAT_RATE", "1"))
+        self.chat_burst = chat_burst or float(os.getenv("SEND_CHAT_BURST", "3"))
+        self.max_retries = max_retries or int(os.getenv("SEND_MAX_RETRIES", "3"))
+        self.max_chats = int(os.getenv("SEND_CHAT_BUCKETS", "10000"))
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            self._evict()
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _evict(self):
+        if len(self._chats) <= self.max_chats:
+            return
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.idle]:
+            del self._chats[chat_id]
+            if len(self._chats) <= self.max_chats:
+                break
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        chat_bucket = self._chat_bucket(chat_id) if isinstance(chat_id, int) else None
+        attempt = 0
+        while True:
+            if chat_bucket:
+                await chat_bucket.acquire(priority)
+            await self.global_bucket.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(f"Flood Control в чате {chat_id}: пауза {e.retry_after} сек.")
+                if chat_bucket:
+                    chat_bucket.pause(e.retry_after)
+                else:
+                    await asyncio.sleep(e.retry_after)
@@ -0,0 +1,151 @@
+# src/render.py
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from .metrics import RENDER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "fps": 1,
+    "preset": "veryfast",
+    "crf": 28,
+    "audio_bitrate": "320k",
+}
+
+# Кодеки, которые можно положить в MP4 без перекодирования
+COPYABLE_AUDIO = {"aac", "mp3"}
+
+
+def probe_audio_codec(audio_path: str) -> Optional[str]:
+    """Кодек первой аудиодорожки через ffprobe"""
+    if not shutil.which("ffprobe"):
+        return None
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-select_streams", "a:0",
+            "-show_entries", "stream=codec_name",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            audio_path
+        ],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def render_still_ffmpeg(photo_path: str, audio_path: str, output_path: str, settings: Dict):
+    """Быстрый путь: одна картинка + аудио.
+
+    Кадр кодируется с -tune stillimage и минимальной частотой кадров,
+    аудио копируется без перекодирования, если контейнер это позволяет.
+    """
+    fps = str(settings["fps"])
+    if probe_audio_codec(audio_path) in COPYABLE_AUDIO:
+        audio_args = ["-c:a", "copy"]
+    else:
+        audio_args = ["-c:a", "aac", "-b:a", settings["audio_bitrate"]]
+
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-loop", "1", "-framerate", fps, "-i", photo_path,
+        "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        # libx264 требует четные размеры кадра
+        "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p",
+        "-c:v", "libx264", "-tune", "stillimage",
+        "-preset", settings["preset"], "-crf", str(settings["crf"]),
+        "-r", fps,
+        *audio_args,
+        "-shortest", "-movflags", "+faststart",
+        output_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg: {result.stderr.strip()[-500:]}")
+
+
+def render_moviepy(photo_path: str, audio_path: str, output_path: str, settings: Dict):
+    """Универсальный путь через moviepy для сложных композиций"""
+    from moviepy.editor import ImageClip, AudioFileClip
+
+    audio = AudioFileClip(audio_path)
+    clip = ImageClip(photo_path).set_duration(audio.duration)
+    clip = clip.set_audio(audio)
+    clip.write_videofile(output_path, fps=settings["fps"], preset=settings["preset"], logger=None)
+
+
+def render_video(photo_path: str, audio_path: str, output_path: str, backend: str, settings: Dict) -> float:
+    """Рендер в дочернем процессе, возвращает длительность в секундах"""
+    started_at = time.monotonic()
+    if backend in ("auto", "ffmpeg") and shutil.which("ffmpeg"):
+        try:
+            render_still_ffmpeg(photo_path, audio_path, output_path, settings)
+            return time.monotonic() - started_at
+        except Exception as e:
+            if backend == "ffmpeg":
+                raise
+            logger.warning(f"ffmpeg не справился, используем moviepy: {str(e)}")
+    elif backend == "ffmpeg":
+        raise RuntimeError("ffmpeg не найден")
+
+    render_moviepy(photo_path, audio_path, output_path, settings)
+    return time.monotonic() - started_at
+
+
+class RenderEngine:
+    """Рендер видео в пуле процессов.
+
+    Бэкенд выбирается через RENDER_BACKEND: auto (ffmpeg с откатом на
+    moviepy), ffmpeg или moviepy.
+    """
+
+    def __init__(self, backend: Optional[str] = None, workers: Optional[int] = None):
+        self.backend = backend or os.getenv("RENDER_BACKEND", "auto")
+        self.settings = {
+            **DEFAULT_SETTINGS,
+            "fps": int(os.getenv("RENDER_FPS", DEFAULT_SETTINGS["fps"])),
+            "preset": os.getenv("RENDER_PRESET", DEFAULT_SETTINGS["preset"]),
+        }
+        # forkserver: дочерние процессы не наследуют потоки и event loop бота,
+        # а ответвляются от сервера, в котором уже импортирован только этот модуль
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers or int(os.getenv("RENDER_WORKERS", "2")),
+            mp_context=context
+        )
+
+    async def render(
+            self,
+            photo_path: str,
+            audio_path: str,
+            output_path: str,
+            settings: Optional[Dict] = None
+    ) -> float:
+        loop = asyncio.get_running_loop()
+        duration = await loop.run_in_executor(
+            self._pool,
+            render_video,
+            photo_path,
+            audio_path,
+            output_path,
+            self.backend,
+            {**self.settings, **(settings or {})}
+        )
+        RENDER_SECONDS.labels(backend=self.backend).observe(duration)
+        logger.info(f"Видео {output_path} отрендерено за {duration:.1f} сек.")
+        return duration
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
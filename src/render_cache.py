@@ -0,0 +1,154 @@
+# src/render_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK = 1024 * 1024
+
+
+class RenderCache:
+    """Контентно-адресуемый кэш отрендеренных видео на диске.
+
+    Ключ - sha256 от байтов фото, аудио и настроек рендера. Размер каталога
+    ограничен, вытесняются давно не использованные файлы (по mtime).
+    Одновременные запросы одного ключа рендерятся один раз: внутри процесса
+    через общий future, между процессами через lock-файл.
+    Задачи получают собственную жесткую ссылку на видео (checkout), поэтому
+    вытеснение не ломает загрузки, которые еще ждут в очереди.
+    """
+
+    def __init__(
+            self,
+            directory: Optional[str] = None,
+            max_bytes: Optional[int] = None,
+            lock_timeout: Optional[float] = None
+    ):
+        self.directory = Path(directory or os.getenv("RENDER_CACHE_DIR", "temp/render_cache"))
+        self.max_bytes = max_bytes or int(os.getenv("RENDER_CACHE_MAX_MB", "2048")) * 1024 * 1024
+        self.lock_timeout = lock_timeout or float(os.getenv("RENDER_CACHE_LOCK_TIMEOUT", "900"))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _hash_inputs(photo_path: str, audio_path: str, settings: Dict) -> str:
+        digest = hashlib.sha256()
+        for path in (photo_path, audio_path):
+            with open(path, "rb") as f:
+                while block := f.read(HASH_BLOCK):
+                    digest.update(block)
+            digest.update(b"\0")
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    async def key(self, photo_path: str, audio_path: str, settings: Dict) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._hash_inputs, photo_path, audio_path, settings)
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.mp4"
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Готовое видео по ключу (с обновлением времени доступа)"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    async def checkout(self, path: Path, prefix: str, directory: str = "temp") -> Path:
+        """Собственный файл задачи: жесткая ссылка на видео кэша, на другой ФС - копия"""
+        target = Path(directory) / f"{prefix}_{uuid.uuid4().hex}.mp4"
+        try:
+            os.link(path, target)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            await asyncio.get_running_loop().run_in_executor(None, shutil.copyfile, path, target)
+        return target
+
+    async def get_or_render(self, key: str, render: Callable[[str], Awaitable]) -> Tuple[Path, bool]:
+        """Видео из кэша или рендер через render(output_path). Второй элемент - попадание в кэш"""
+        if cached := self.lookup(key):
+            return cached, True
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key]), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            path, hit = await self._render_locked(key, render)
+            future.set_result(path)
+            return path, hit
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным, если ожидающих нет
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _render_locked(self, key: str, render: Callable[[str], Awaitable]) -> Tuple[Path, bool]:
+        path = self.path(key)
+        lock_path = self.directory / f"{key}.lock"
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                if cached := self.lookup(key):
+                    return cached, True
+                try:
+                    if time.time() - lock_path.stat().st_mtime > self.lock_timeout:
+                        logger.warning(f"Устаревшая блокировка рендера {key}, снимаем")
+                        lock_path.unlink(missing_ok=True)
+                except FileNotFoundError:
+                    pass
+                await asyncio.sleep(0.5)
+
+        part_path = self.directory / f"{key}.{uuid.uuid4().hex}.part.mp4"
+        try:
+            if cached := self.lookup(key):
+                return cached, True
+            await render(str(part_path))
+            os.replace(part_path, path)
+        finally:
+            part_path.unlink(missing_ok=True)
+            lock_path.unlink(missing_ok=True)
+
+        await asyncio.get_running_loop().run_in_executor(None, self.evict)
+        return path, False
+
+    def evict(self):
+        """Удаление давно не использованных видео сверх лимита размера"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".mp4") or entry.name.endswith(".part.mp4"):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        # Самое свежее видео не вытесняем, даже если оно больше лимита
+        for _, size, path in sorted(entries)[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                logger.info(f"Видео {path} вытеснено из кэша рендера")
+            except FileNotFoundError:
+                pass
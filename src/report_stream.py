@@ -0,0 +1,103 @@
+# src/report_stream.py
+import heapq
+import itertools
+import math
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Лимит Telegram - 4096 символов, оставляем запас
+TELEGRAM_CHUNK_SIZE = 4000
+
+
+class ReportStream:
+    """Потоковый отчет по сообщениям.
+
+    Хранит в куче только K новейших сообщений (строки форматируются один
+    раз при попадании в кучу). Все, что новее watermark источника, уже не
+    может быть вытеснено или переставлено, поэтому такие строки сразу
+    уходят в буфер, а заполненные чанки отправляются, не дожидаясь конца
+    сбора. Чанки режутся только по границам строк.
+    """
+
+    def __init__(
+            self,
+            send: Callable[[str], Awaitable],
+            limit: Optional[int] = None,
+            chunk_size: int = TELEGRAM_CHUNK_SIZE,
+            header: str = "📨 Последние сообщения:",
+            empty_text: str = "📭 Нет сообщений за выбранный период"
+    ):
+        self.send = send
+        self.limit = limit or int(os.getenv("INSTAGRAM_REPORT_LIMIT", "50"))
+        self.chunk_size = chunk_size
+        self.header = header
+        self.empty_text = empty_text
+        self._heap = []
+        self._seq = itertools.count()
+        self._emitted = 0
+        self._lines: List[str] = [header]
+        self._length = len(header)
+
+    @staticmethod
+    def format_message(msg: Dict) -> str:
+        dt = datetime.fromtimestamp(msg['timestamp'])
+        return (
+            f"{dt.strftime('%d.%m.%Y %H:%M')} "
+            f"@{msg['user']}: {msg['text'][:100]}"
+        )
+
+    def add(self, messages: List[Dict]):
+        """Учет пачки сообщений в top-K"""
+        capacity = self.limit - self._emitted
+        for msg in messages:
+            if capacity <= 0:
+                return
+            if len(self._heap) < capacity:
+                heapq.heappush(self._heap, (msg['timestamp'], next(self._seq), self.format_message(msg)))
+            elif msg['timestamp'] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, (msg['timestamp'], next(self._seq), self.format_message(msg)))
+
+    async def advance(self, watermark: float):
+        """Вывод строк новее watermark и отправка заполненных чанков"""
+        ready = [entry for entry in self._heap if entry[0] > watermark]
+        if not ready:
+            return
+        self._heap = [entry for entry in self._heap if entry[0] <= watermark]
+        heapq.heapify(self._heap)
+        self._emitted += len(ready)
+        for _, _, line in sorted(ready, reverse=True):
+            await self._append(line)
+
+    async def close(self):
+        """Вывод оставшихся строк и отправка последнего чанка"""
+        await self.advance(-math.inf)
+        if not self._emitted:
+            await self.send(self.empty_text)
+        elif self._lines:
+            await self._flush()
+
+    async def _append(self, line: str):
+        for part in self._split(line):
+            if self._lines and self._length + 1 + len(part) > self.chunk_size:
+                await self._flush()
+            self._length += len(part) + (1 if self._lines else 0)
+            self._lines.append(part)
+
+    def _split(self, line: str) -> List[str]:
+        """Разбиение строки длиннее чанка по пробелам (или жестко)"""
+        parts = []
+        while len(line) > self.chunk_size:
+            cut = line.rfind(" ", 0, self.chunk_size)
+            if cut <= 0:
+                cut = self.chunk_size
+            parts.append(line[:cut])
+            line = line[cut:].lstrip(" ")
+        parts.append(line)
+        return parts
+
+    async def _flush(self):
+        text = "\n".join(self._lines)
+        self._lines = []
+        self._length = 0
+        await self.send(text)
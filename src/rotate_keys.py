@@ -0,0 +1,27 @@
+# src/rotate_keys.py
+"""Перешифровка данных пользователей новым ключом: python -m src.rotate_keys
+
+Порядок ротации: новый ключ ставится в ENCRYPTION_KEY, прежний - в
+ENCRYPTION_OLD_KEYS, бот перезапускается. Затем запускается эта команда
+(можно при работающем боте). После нее прежний ключ можно убрать
+из ENCRYPTION_OLD_KEYS.
+"""
+import asyncio
+import logging
+
+from src.utils import rotate_user_data, storage
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    try:
+        rotated = await rotate_user_data()
+        logger.info(f"Перешифровано полей: {rotated}")
+    finally:
+        await storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
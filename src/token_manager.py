@@ -0,0 +1,176 @@
+# src/token_manager.py
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+from .metrics import YOUTUBE_ERRORS, YOUTUBE_SECONDS, track
+from .utils import get_user_data, get_users_fields, update_user_data, storage
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_KEY = "yt_token_expiry"
+# Запас, при котором токен обновляется прямо в запросе
+INLINE_REFRESH_MARGIN = 300
+TOKEN_FIELDS = ("token", "refresh_token", "client_id", "client_secret", "token_uri", "scopes")
+
+
+def parse_expiry(value: str) -> datetime:
+    """Срок действия токена в UTC (старые записи хранились без часового пояса)"""
+    expiry = datetime.fromisoformat(value)
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    return expiry.astimezone(timezone.utc)
+
+
+class TokenManager:
+    """OAuth-токены YouTube: хранение и обновление.
+
+    Одновременные обновления токена одного пользователя объединяются в одну
+    операцию, сам запрос к Google выполняется в пуле потоков. Фоновый
+    планировщик обновляет токены заранее, по zset yt_token_expiry
+    (user_id -> срок действия), поэтому загрузки не ждут обновления.
+    """
+
+    def __init__(
+            self,
+            on_refresh: Optional[Callable[[int], None]] = None,
+            refresh_margin: Optional[float] = None,
+            scan_interval: Optional[float] = None
+    ):
+        self.on_refresh = on_refresh
+        self.refresh_margin = refresh_margin or float(os.getenv("YT_TOKEN_REFRESH_MARGIN", "600"))
+        self.scan_interval = scan_interval or float(os.getenv("YT_TOKEN_SCAN_INTERVAL", "60"))
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self, user_id: int) -> Optional[Dict]:
+        data = await get_user_data(user_id, "youtube_token")
+        return json.loads(data.decode()) if data else None
+
+    async def store(self, user_id: int, token_data: Dict):
+        expiry = parse_expiry(token_data["expiry"])
+        token_data = {**token_data, "expiry": expiry.isoformat()}
+        await update_user_data(user_id, "youtube_token", json.dumps(token_data))
+        await storage.redis.zadd(EXPIRY_KEY, {user_id: expiry.timestamp()})
+        if self.on_refresh:
+            self.on_refresh(user_id)
+
+    @staticmethod
+    def build(token_data: Dict) -> Credentials:
+        # google-auth сравнивает expiry с naive-временем в UTC
+        return Credentials(
+            **{field: token_data.get(field) for field in TOKEN_FIELDS},
+            expiry=parse_expiry(token_data["expiry"]).replace(tzinfo=None)
+        )
+
+    async def credentials(self, user_id: int) -> Optional[Credentials]:
+        """Действующие учетные данные пользователя (обновляются при необходимости)"""
+        token_data = await self.load(user_id)
+        if not token_data:
+            return None
+
+        expiry = parse_expiry(token_data["expiry"])
+        # Записи, сохраненные до появления планировщика, ставим в расписание
+        await storage.redis.zadd(EXPIRY_KEY, {user_id: expiry.timestamp()}, nx=True)
+        if expiry.timestamp() - time.time() < INLINE_REFRESH_MARGIN:
+            token_data = await self.refresh(user_id)
+        return self.build(token_data)
+
+    async def refresh(self, user_id: int) -> Dict:
+        """Обновление токена; параллельные вызовы ждут одну операцию"""
+        if user_id in self._inflight:
+            return await asyncio.shield(self._inflight[user_id])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            token_data = await self._refresh(user_id)
+            future.set_result(token_data)
+            return token_data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[user_id]
+
+    async def _refresh(self, user_id: int) -> Dict:
+        token_data = await self.load(user_id)
+        if not token_data:
+            await storage.redis.zrem(EXPIRY_KEY, user_id)
+            raise ValueError("❌ Authentication required")
+
+        # Другая реплика могла уже обновить токен
+        if parse_expiry(token_data["expiry"]).timestamp() - time.time() > self.refresh_margin:
+            return token_data
+
+        credentials = self.build(token_data)
+        try:
+            with track(YOUTUBE_SECONDS, YOUTUBE_ERRORS, method="oauth.refresh"):
+                await asyncio.get_running_loop().run_in_executor(None, credentials.refresh, Request())
+        except RefreshError:
+            # Токен отозван - до новой авторизации обновлять нечего
+            await storage.redis.zrem(EXPIRY_KEY, user_id)
+            if self.on_refresh:
+                self.on_refresh(user_id)
+            raise
+
+        token_data.update({
+            "token": credentials.token,
+            "expiry": credentials.expiry.replace(tzinfo=timezone.utc).isoformat()
+        })
+        await self.store(user_id, token_data)
+        logger.info(f"Токен YouTube пользователя {user_id} обновлен")
+        return token_data
+
+    async def start(self):
+        self._task = asyncio.create_task(self._scheduler(), name="yt-token-refresher")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _scheduler(self):
+        while True:
+            try:
+                await self._refresh_due()
+                delay = self.scan_interval
+                upcoming = await storage.redis.zrange(EXPIRY_KEY, 0, 0, withscores=True)
+                if upcoming:
+                    delay = min(delay, max(upcoming[0][1] - self.refresh_margin - time.time(), 1))
+            except Exception as e:
+                logger.error(f"Ошибка планировщика токенов: {str(e)}")
+                delay = self.scan_interval
+            await asyncio.sleep(delay)
+
+    async def _refresh_due(self):
+        due = [int(member) for member in await storage.redis.zrangebyscore(
+            EXPIRY_KEY, "-inf", time.time() + self.refresh_margin
+        )]
+        # Токены всех пользователей - в кэш одним конвейером
+        await get_users_fields(due, ["youtube_token"])
+        for user_id in due:
+            # Одного пользователя обновляет только одна реплика
+            if not await storage.redis.set(f"yt_token_lock:{user_id}", 1, nx=True, ex=60):
+                continue
+            try:
+                await self.refresh(user_id)
+            except Exception as e:
+                logger.warning(f"Не удалось заранее обновить токен {user_id}: {str(e)}")
+                # Повтор не раньше следующего цикла
+                await storage.redis.zadd(EXPIRY_KEY, {user_id: time.time() + self.refresh_margin + self.scan_interval}, xx=True)
+            finally:
+                await storage.redis.delete(f"yt_token_lock:{user_id}")
@@ -0,0 +1,136 @@
+# src/update_scheduler.py
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledDispatcher(Dispatcher):
+    """Dispatcher с планировщиком обновлений.
+
+    Обновления одного чата обрабатываются строго по порядку (FSM не видит
+    перестановок), разных чатов - параллельно, но не больше
+    max_concurrency одновременно. Очередь чата ограничена, лишние
+    обновления отбрасываются с уведомлением пользователя; повторные нажатия
+    той же кнопки, пока обрабатывается первое, игнорируются.
+
+    feed_update возвращает управление только после обработки обновления,
+    поэтому ограничение вебхука (WEBHOOK_MAX_UPDATES) действует на всю
+    обработку, а не только на постановку в очередь.
+    """
+
+    def __init__(
+            self,
+            *args,
+            max_concurrency: Optional[int] = None,
+            chat_queue_size: Optional[int] = None,
+            **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max_concurrency or int(os.getenv("UPDATES_MAX_CONCURRENCY", "64"))
+        self.chat_queue_size = chat_queue_size or int(os.getenv("UPDATES_CHAT_QUEUE", "20"))
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._queues: Dict[int, Deque[Tuple[Bot, Update, Dict[str, Any], Optional[Tuple], asyncio.Future]]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._callbacks: Set[Tuple] = set()
+
+    @staticmethod
+    def _chat_key(update: Update) -> Optional[int]:
+        try:
+            event = update.event
+        except Exception:
+            return None
+        chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+        if chat:
+            return chat.id
+        user = getattr(event, "from_user", None)
+        return user.id if user else None
+
+    @staticmethod
+    def _callback_signature(chat_id: int, update: Update) -> Optional[Tuple]:
+        callback = update.callback_query
+        if not callback:
+            return None
+        message_id = callback.message.message_id if callback.message else callback.inline_message_id
+        return chat_id, callback.from_user.id, message_id, callback.data
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs: Any) -> Any:
+        chat_id = self._chat_key(update)
+        if chat_id is None:
+            async with self._slots:
+                return await super().feed_update(bot, update, **kwargs)
+
+        signature = self._callback_signature(chat_id, update)
+        if signature and signature in self._callbacks:
+            logger.debug(f"Повторное нажатие в чате {chat_id} отброшено")
+            try:
+                await bot.answer_callback_query(update.callback_query.id)
+            except Exception as e:
+                logger.debug(f"Не удалось ответить на повторное нажатие: {str(e)}")
+            return None
+
+        queue = self._queues.setdefault(chat_id, deque())
+        if len(queue) >= self.chat_queue_size:
+            logger.warning(f"Очередь чата {chat_id} переполнена, обновление {update.update_id} отброшено")
+            await self._notify_dropped(bot, chat_id, update)
+            return None
+
+        if signature:
+            self._callbacks.add(signature)
+        done = asyncio.get_running_loop().create_future()
+        queue.append((bot, update, kwargs, signature, done))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id), name=f"chat-{chat_id}")
+        # Ждем обработки: слот вебхука остается занятым, пока обновление в очереди
+        return await done
+
+    @staticmethod
+    async def _notify_dropped(bot: Bot, chat_id: int, update: Update):
+        text = "⚠️ Слишком много запросов подряд, последнее действие пропущено. Повторите его позже"
+        try:
+            if update.callback_query:
+                await bot.answer_callback_query(update.callback_query.id, text=text)
+            else:
+                await bot.send_message(chat_id, text)
+        except Exception as e:
+            logger.debug(f"Не удалось сообщить об отброшенном обновлении: {str(e)}")
+
+    async def _drain(self, chat_id: int):
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                bot, update, kwargs, signature, done = queue[0]
+                result = None
+                try:
+                    async with self._slots:
+                        result = await super().feed_update(bot, update, **kwargs)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки обновления {update.update_id}: {str(e)}")
+                finally:
+                    queue.popleft()
+                    self._callbacks.discard(signature)
+                    if not done.done():
+                        done.set_result(result)
+        finally:
+            # При отмене (остановка бота) необработанные обновления не подтверждаются
+            for *_, done in queue:
+                done.cancel()
+            del self._workers[chat_id]
+            if not queue:
+                self._queues.pop(chat_id, None)
+
+    async def drain(self, timeout: float = 10):
+        """Дождаться обработки очередей (остаток отменяется по тайм-ауту)"""
+        workers = list(self._workers.values())
+        if not workers:
+            return
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -1,26 +1,87 @@
 import asyncio
 import json
 import os
-from typing import Optional
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
 from aiogram.fsm.storage.redis import RedisStorage
-from cryptography.fernet import Fernet
+from redis.asyncio import BlockingConnectionPool, Redis
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from dotenv import load_dotenv
 
+from .metrics import REDIS_SECONDS, track
+
 import logging
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 REQUIRED_ENV = ["TELEGRAM_TOKEN", "REDIS_URL", "ENCRYPTION_KEY"]
-fernet = Fernet(os.getenv("ENCRYPTION_KEY").encode())
+# Первый ключ шифрует, все перечисленные - расшифровывают.
+# Для ротации новый ключ ставится в ENCRYPTION_KEY, прежний - в ENCRYPTION_OLD_KEYS.
+# Поля user:* переходят на новый ключ при записи или все сразу через
+# python -m src.rotate_keys, после чего прежний ключ можно убрать
+fernet = MultiFernet([
+    Fernet(key.strip().encode())
+    for key in [os.getenv("ENCRYPTION_KEY"), *os.getenv("ENCRYPTION_OLD_KEYS", "").split(",")]
+    if key and key.strip()
+])
+
+# Формат хранения полей user:{id}: "v2." + Fernet(флаг + данные),
+# флаг z - данные сжаты zlib, r - без сжатия (короткие значения)
+ENVELOPE_PREFIX = b"v2."
+COMPRESS_MIN_BYTES = 256
+
+
+def seal(payload: bytes) -> bytes:
+    """Упаковка значения в конверт v2: сжатие и однократное шифрование"""
+    if len(payload) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            return ENVELOPE_PREFIX + fernet.encrypt(b"z" + compressed)
+    return ENVELOPE_PREFIX + fernet.encrypt(b"r" + payload)
+
 
-storage = RedisStorage.from_url(
+def unseal(data: bytes) -> Tuple[bytes, bool]:
+    """Значение из конверта. Второй элемент - True для старого формата"""
+    if data.startswith(ENVELOPE_PREFIX):
+        plain = fernet.decrypt(data[len(ENVELOPE_PREFIX):])
+        return (zlib.decompress(plain[1:]) if plain[:1] == b"z" else plain[1:]), False
+
+    # Старый формат: Fernet-токен, в который сессии и токены
+    # сохранялись уже зашифрованными еще раз
+    payload = fernet.decrypt(data)
+    try:
+        payload = fernet.decrypt(payload)
+    except InvalidToken:
+        # Внутреннего слоя нет - значение было зашифровано один раз
+        pass
+    return payload, True
+
+# Общий пул соединений: при исчерпании запрос ждет свободное соединение
+# до REDIS_POOL_TIMEOUT секунд, а не открывает новое
+redis_pool = BlockingConnectionPool.from_url(
     os.getenv("REDIS_URL"),
-    connection_kwargs={
-        "socket_connect_timeout": 5,
-        "retry_on_timeout": True
-    }
+    max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+    timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "5")),
+    health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")),
+    socket_connect_timeout=5,
+    socket_keepalive=True,
+    retry_on_timeout=True
 )
+storage = RedisStorage(redis=Redis(connection_pool=redis_pool))
+
+# Перезапись поля, только если оно не изменилось с момента чтения
+MIGRATE_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+migrate_field = storage.redis.register_script(MIGRATE_SCRIPT)
 
 async def run_subprocess(cmd: list) -> bool:
     try:
@@ -36,25 +97,192 @@ async def run_subprocess(cmd: list) -> bool:
         return False
 
 async def get_instagram_session(user_id: int) -> Optional[dict]:
-    encrypted = await get_user_data(user_id, "instagram_session")
-    if not encrypted:
+    session = await get_user_data(user_id, "instagram_session")
+    if not session:
         return None
-    return json.loads(fernet.decrypt(encrypted.encode()).decode())
+    return json.loads(session)
 
 async def decrypt_user_data(user_id: int, key: str) -> Optional[bytes]:
     try:
-        user_data = await get_user_data(user_id)
-        if encrypted := user_data.get(key):
-            return fernet.decrypt(encrypted.encode())
-        return None
+        return await get_user_data(user_id, key)
     except Exception as e:
         logger.error(f"Ошибка дешифрования: {str(e)}")
         return None
 
+class UserDataCache:
+    """LRU-кэш расшифрованных полей user:{id} с TTL.
+
+    Запись поля публикует инвалидацию в канал Redis, остальные процессы
+    бота (реплики, воркеры) удаляют у себя устаревшую запись.
+    """
+
+    CHANNEL = "user_data:invalidate"
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("USER_CACHE_SIZE", "10000"))
+        self.ttl = ttl or float(os.getenv("USER_CACHE_TTL", "60"))
+        self.instance_id = uuid.uuid4().hex
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, Optional[bytes]]]" = OrderedDict()
+        # Растет при каждой инвалидации: значение, прочитанное до нее, не кэшируется
+        self._generation = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, user_id: int, key: str) -> Tuple[bool, Optional[bytes]]:
+        entry = self._entries.get((user_id, key))
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end((user_id, key))
+        self.hits += 1
+        return True, entry[1]
+
+    def set(self, user_id: int, key: str, value: Optional[bytes], generation: int):
+        if generation != self._generation:
+            return
+        self._entries[(user_id, key)] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end((user_id, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def invalidate(self, user_id: int, key: str):
+        self._generation += 1
+        self._entries.pop((user_id, key), None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def message(self, user_id: int, key: str) -> str:
+        """Сообщение об инвалидации для канала CHANNEL"""
+        return f"{self.instance_id}:{user_id}:{key}"
+
+    async def start(self):
+        self._task = asyncio.create_task(self._listen(), name="user-cache-invalidation")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _listen(self):
+        while True:
+            pubsub = storage.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                # Пока подписки не было, инвалидации могли потеряться
+                self.clear()
+                async for message in pubsub.listen():
+                    instance_id, user_id, key = message["data"].decode().split(":", 2)
+                    if instance_id != self.instance_id:
+                        self.invalidate(int(user_id), key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка подписки на инвалидации кэша: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+user_cache = UserDataCache()
+
+
+async def get_users_fields(user_ids: Iterable[int], keys: List[str]) -> Dict[int, Dict[str, Optional[bytes]]]:
+    """Поля нескольких пользователей: промахи кэша читаются одним конвейером HMGET"""
+    result: Dict[int, Dict[str, Optional[bytes]]] = {}
+    missing: Dict[int, List[str]] = {}
+    for user_id in user_ids:
+        result[user_id] = {}
+        for key in keys:
+            found, value = user_cache.get(user_id, key)
+            if found:
+                result[user_id][key] = value
+            else:
+                missing.setdefault(user_id, []).append(key)
+    if not missing:
+        return result
+
+    generation = user_cache.generation
+    pipe = storage.redis.pipeline(transaction=False)
+    for user_id, fields in missing.items():
+        pipe.hmget(f"user:{user_id}", fields)
+    with track(REDIS_SECONDS, operation="user_fields_get"):
+        responses = await pipe.execute()
+    legacy = []
+    for (user_id, fields), values in zip(missing.items(), responses):
+        for key, data in zip(fields, values):
+            value = None
+            if data:
+                value, is_legacy = unseal(data)
+                if is_legacy:
+                    legacy.append((user_id, key, data, value))
+            user_cache.set(user_id, key, value, generation)
+            result[user_id][key] = value
+
+    if legacy:
+        await migrate_legacy(legacy)
+    return result
+
+async def migrate_legacy(fields: List[Tuple[int, str, bytes, bytes]]):
+    """Перезапись значений старого формата в конверт v2 при чтении"""
+    try:
+        pipe = storage.redis.pipeline(transaction=False)
+        for user_id, key, data, value in fields:
+            await migrate_field(keys=[f"user:{user_id}"], args=[key, data, seal(value)], client=pipe)
+        await pipe.execute()
+        logger.info(f"Полей переведено в формат v2: {len(fields)}")
+    except Exception as e:
+        logger.warning(f"Не удалось перевести поля в формат v2: {str(e)}")
+
+async def rotate_user_data() -> int:
+    """Перешифровка всех полей user:* текущим ключом (python -m src.rotate_keys)"""
+    rotated = 0
+    async for name in storage.redis.scan_iter(match="user:*", count=500):
+        data = await storage.redis.hgetall(name)
+        pipe = storage.redis.pipeline(transaction=False)
+        for key, value in data.items():
+            try:
+                payload, _ = unseal(value)
+            except InvalidToken:
+                logger.warning(f"Поле {key.decode()} в {name.decode()} не расшифровывается ни одним ключом")
+                continue
+            await migrate_field(keys=[name], args=[key, value, seal(payload)], client=pipe)
+        rotated += sum(await pipe.execute())
+    return rotated
+
+async def get_user_fields(user_id: int, *keys: str) -> Dict[str, Optional[bytes]]:
+    return (await get_users_fields([user_id], list(keys)))[user_id]
+
 async def get_user_data(user_id: int, key: str) -> Optional[bytes]:
-    data = await storage.redis.hget(f"user:{user_id}", key)
-    return fernet.decrypt(data) if data else None
+    return (await get_user_fields(user_id, key))[key]
+
+async def update_users_fields(updates: Dict[int, Dict[str, str]]):
+    """Запись полей нескольких пользователей за один round-trip"""
+    pipe = storage.redis.pipeline(transaction=False)
+    for user_id, values in updates.items():
+        pipe.hset(f"user:{user_id}", mapping={
+            key: seal(value.encode()) for key, value in values.items()
+        })
+        for key in values:
+            pipe.publish(UserDataCache.CHANNEL, user_cache.message(user_id, key))
+    with track(REDIS_SECONDS, operation="user_fields_set"):
+        await pipe.execute()
+    for user_id, values in updates.items():
+        for key in values:
+            user_cache.invalidate(user_id, key)
+
+async def update_user_fields(user_id: int, values: Dict[str, str]):
+    await update_users_fields({user_id: values})
 
 async def update_user_data(user_id: int, key: str, value: str):
-    encrypted = fernet.encrypt(value.encode())
-    await storage.redis.hset(f"user:{user_id}", key, encrypted)
\ No newline at end of file
+    await update_user_fields(user_id, {key: value})
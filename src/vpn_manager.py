@@ -1,49 +1,126 @@
+import asyncio
+import logging
 import os
-import subprocess
 import time
 from pathlib import Path
+from typing import Optional
+
+from .utils import run_subprocess
+
+logger = logging.getLogger(__name__)
 
 
 class VPNManager:
-    def connect(self):
-        """Новая реализация метода"""
-        return self.start()  # Используем существующий метод start()
-
-    def start(self):
-        # Существующая реализация
-        try:
-            subprocess.run(
-                ["sudo", "openvpn", "--config", str(self.config_path), "--daemon"],
-                check=True
-            )
+    """Серверный VPN-туннель (OpenVPN).
+
+    Фоновая проба раз в VPN_CHECK_INTERVAL проверяет туннель и кэширует
+    результат на VPN_STATE_TTL секунд, обработчики читают только этот флаг.
+    Упавший туннель переподключается с экспоненциальной задержкой.
+    openvpn --daemon возвращается до рукопожатия, поэтому после запуска
+    туннель ждут до VPN_CONNECT_TIMEOUT секунд, прежде чем считать
+    подключение неудачным.
+    """
+
+    def __init__(
+            self,
+            config_path: Optional[str] = None,
+            check_host: Optional[str] = None,
+            interval: Optional[float] = None,
+            ttl: Optional[float] = None
+    ):
+        self.config_path = Path(config_path or os.getenv("SERVER_VPN_CONFIG", "vpn/server.ovpn"))
+        self.check_host = check_host or os.getenv("VPN_CHECK_HOST", "instagram.com")
+        self.interval = interval or float(os.getenv("VPN_CHECK_INTERVAL", "30"))
+        self.ttl = ttl or float(os.getenv("VPN_STATE_TTL", "90"))
+        self.required = os.getenv("VPN_REQUIRED", "True") == "True"
+        self.min_backoff = float(os.getenv("VPN_BACKOFF_MIN", "5"))
+        self.max_backoff = float(os.getenv("VPN_BACKOFF_MAX", "300"))
+        self.connect_timeout = float(os.getenv("VPN_CONNECT_TIMEOUT", "30"))
+        self._active = False
+        self._checked_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def is_active(self) -> bool:
+        """Последний результат проверки, если он не устарел"""
+        return self._active and time.monotonic() - self._checked_at < self.ttl
+
+    def request_check(self):
+        """Внеочередная проверка туннеля фоновой пробой"""
+        self._wakeup.set()
+
+    async def check(self) -> bool:
+        self._active = await run_subprocess(["ping", "-c", "1", "-W", "3", self.check_host])
+        self._checked_at = time.monotonic()
+        return self._active
+
+    async def wait_connected(self) -> bool:
+        """Ожидание поднятия туннеля после запуска, не дольше connect_timeout"""
+        deadline = time.monotonic() + self.connect_timeout
+        while not await self.check():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(min(2.0, max(deadline - time.monotonic(), 0)))
+        return True
+
+    async def connect(self) -> str:
+        if not await self._launch():
+            await self.check()
+            return "❌ Ошибка запуска VPN"
+        if await self.wait_connected():
             return "✅ VPN успешно запущен"
-        except subprocess.CalledProcessError as e:
-            return f"❌ Ошибка запуска VPN: {e.stderr.decode()}"
+        return f"⚠️ VPN запущен, но туннель не поднялся за {self.connect_timeout:.0f} сек."
 
-    def stop(self):
+    async def start(self) -> str:
+        if await self._launch():
+            return "✅ VPN успешно запущен"
+        return "❌ Ошибка запуска VPN"
+
+    async def _launch(self) -> bool:
+        return await run_subprocess(["sudo", "openvpn", "--config", str(self.config_path), "--daemon"])
+
+    async def stop(self) -> str:
         """Остановка VPN"""
-        try:
-            if self.process:
-                self.process.terminate()
-                self.process.wait()
-            subprocess.run(["sudo", "pkill", "openvpn"], check=True)
+        self._active = False
+        if await run_subprocess(["sudo", "pkill", "openvpn"]):
             return "🛑 VPN остановлен"
-        except Exception as e:
-            return f"❌ Ошибка остановки VPN: {str(e)}"
-
-    def is_active(self):
-        """Проверка активности VPN через ping"""
-        try:
-            result = subprocess.run(
-                ["ping", "-c", "1", "instagram.com"],
-                capture_output=True,
-                text=True
-            )
-            return result.returncode == 0
-        except:
-            return False
-
-    def restart(self):
-        """Перезапуск VPN"""
-        self.stop()
-        return self.start()
\ No newline at end of file
+        return "❌ Ошибка остановки VPN"
+
+    async def restart(self) -> str:
+        """Перезапуск VPN с ожиданием туннеля"""
+        await self.stop()
+        return await self.connect()
+
+    async def start_monitor(self):
+        self._task = asyncio.create_task(self._monitor(), name="vpn-monitor")
+
+    async def stop_monitor(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _monitor(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                if await self.check() or not self.required:
+                    backoff = self.min_backoff
+                else:
+                    logger.warning("VPN недоступен, переподключение")
+                    logger.info(await self.restart())
+                    if not self._active:
+                        # Следующая попытка - после паузы, внеочередные проверки ее не сокращают
+                        logger.warning(f"VPN не поднялся, повтор через {backoff:.0f} сек.")
+                        await asyncio.sleep(backoff)
+                        backoff = min(backoff * 2, self.max_backoff)
+                        continue
+                    backoff = self.min_backoff
+            except Exception as e:
+                logger.error(f"Ошибка проверки VPN: {str(e)}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
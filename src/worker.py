@@ -0,0 +1,34 @@
+# src/worker.py
+"""Отдельный процесс воркеров очереди задач: python -m src.worker
+
+В самом боте при этом можно выключить встроенные воркеры (JOB_WORKERS_EMBEDDED=False).
+На одном хосте с ботом воркеру нужен свой METRICS_PORT.
+"""
+import asyncio
+import logging
+
+from src import main as app
+from src.utils import user_cache
+
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    app.build_services()
+    await app.metrics_server.start()
+    await app.loop_monitor.start()
+    await user_cache.start()
+    await app.job_workers.start()
+    try:
+        await asyncio.Event().wait()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await app.graceful_shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Остановка воркеров по запросу пользователя")
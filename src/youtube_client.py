@@ -0,0 +1,104 @@
+# src/youtube_client.py
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httplib2
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http
+
+logger = logging.getLogger(__name__)
+
+
+class HttpPool:
+    """Потокобезопасный пул httplib2.Http с постоянными соединениями.
+
+    httplib2.Http нельзя использовать из нескольких потоков одновременно,
+    поэтому каждый запрос берет свободный экземпляр из пула и возвращает
+    его обратно вместе с открытыми соединениями.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or int(os.getenv("YT_HTTP_POOL_SIZE", "16"))
+        self._idle: "queue.LifoQueue[httplib2.Http]" = queue.LifoQueue()
+        # build_http убирает 308 из redirect_codes - это нужно для resumable upload
+        template = build_http()
+        self.timeout = template.timeout
+        self.redirect_codes = template.redirect_codes
+        self._idle.put(template)
+
+    def request(self, *args, **kwargs):
+        try:
+            http = self._idle.get_nowait()
+        except queue.Empty:
+            http = build_http()
+        try:
+            return http.request(*args, **kwargs)
+        finally:
+            if self._idle.qsize() < self.size:
+                self._idle.put(http)
+
+
+class YouTubeClientFactory:
+    """Кэш объектов YouTube API по пользователю.
+
+    Discovery-документ загружается один раз (статическая копия из
+    googleapiclient или файл YT_DISCOVERY_DOC), сервисы строятся из него
+    и кэшируются по user_id вместе с токеном, для которого созданы.
+    Все сервисы делят общий пул HTTP-соединений.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("YT_CLIENT_CACHE_SIZE", "256"))
+        self.document = self._load_document()
+        self.http_pool = HttpPool()
+        self._services: "OrderedDict[int, Tuple[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_document() -> Dict:
+        if path := os.getenv("YT_DISCOVERY_DOC"):
+            with open(path, "r") as f:
+                return json.load(f)
+        document = get_static_doc("youtube", "v3")
+        if document is None:
+            raise RuntimeError("Статический discovery-документ YouTube не найден, укажите YT_DISCOVERY_DOC")
+        return json.loads(document)
+
+    @staticmethod
+    def _fingerprint(credentials: Credentials) -> str:
+        return hashlib.sha1((credentials.token or "").encode()).hexdigest()
+
+    def service(self, user_id: int, credentials: Credentials) -> Any:
+        """Сервис YouTube для пользователя (новый, если токен сменился)"""
+        fingerprint = self._fingerprint(credentials)
+        with self._lock:
+            entry = self._services.get(user_id)
+            if entry and entry[0] == fingerprint:
+                self._services.move_to_end(user_id)
+                return entry[1]
+
+        service = build_from_document(
+            self.document,
+            http=AuthorizedHttp(credentials, http=self.http_pool)
+        )
+        logger.debug(f"Создан сервис YouTube для пользователя {user_id}")
+        with self._lock:
+            self._services[user_id] = (fingerprint, service)
+            self._services.move_to_end(user_id)
+            while len(self._services) > self.max_entries:
+                self._services.popitem(last=False)
+        return service
+
+    def invalidate(self, user_id: int):
+        """Сброс сервиса пользователя (новая авторизация, отзыв токена)"""
+        with self._lock:
+            self._services.pop(user_id, None)
@@ -3,10 +3,14 @@ import os
 import json
 import logging
 import asyncio
+import hashlib
+import mmap
 import subprocess
-from datetime import datetime, timedelta, timezone
+import time
+import uuid
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, Dict, List, Tuple, Any
+from typing import Optional, Dict, List, Tuple, Any, Awaitable, Callable
 from aiogram.filters import Command
 
 from aiogram import Bot, Dispatcher, types, F
@@ -18,6 +22,7 @@ from aiogram import Bot, Dispatcher, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.types import (
     Message,
     CallbackQuery,
@@ -25,23 +30,30 @@ from aiogram.types import (
     InlineKeyboardButton
 )
 from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
 from google_auth_oauthlib.flow import InstalledAppFlow
-from moviepy.editor import ImageClip, AudioFileClip
+from googleapiclient.errors import HttpError
 
 from .utils import (
     get_user_data,
-    update_user_data,
-    fernet,
     storage,
     run_subprocess,
     decrypt_user_data
 )
+from .channel_cache import ChannelCache
+from .token_manager import TokenManager
+from .youtube_client import YouTubeClientFactory
+from .youtube_upload import ResumableUploader, UploadProgress
+from .jobs import Job, JobQueue, PermanentJobError
+from .render import RenderEngine
+from .render_cache import RenderCache
+from .metrics import RENDER_CACHE, YOUTUBE_ERRORS, YOUTUBE_SECONDS, track
 
 logger = logging.getLogger(__name__)
 
+STREAM_CHUNK_SIZE = 256 * 1024
+# Причины 403 YouTube API, после которых запрос стоит повторить
+RETRYABLE_FORBIDDEN = {"rateLimitExceeded", "userRateLimitExceeded"}
+
 
 class YouTubeService:
     class YouTubeStates(StatesGroup):
@@ -57,82 +69,167 @@ class YouTubeService:
         VPN_CONFIG_UPLOAD = State()
         MULTI_CHANNEL = State()
 
-    def __init__(self, bot: Bot, dp: Dispatcher):
+    def __init__(self, bot: Bot, dp: Dispatcher, jobs: Optional[JobQueue] = None):
         self.bot = bot
         self.dp = dp
         self.states = self.YouTubeStates()
+        self.clients = YouTubeClientFactory()
+        self.tokens = TokenManager(on_refresh=self.clients.invalidate)
+        self.channels = ChannelCache(self.fetch_youtube_channels)
+        self.uploader = ResumableUploader()
+        self.stream_uploads = os.getenv("YT_STREAM_UPLOADS", "True") == "True"
+        # Общий лимит на скачивание из Telegram: загрузка большого видео идет долго
+        self.stream_timeout = int(os.getenv("YT_STREAM_TIMEOUT", "3600"))
+        # Загрузка на чужие каналы возможна только от имени владельца контента
+        self.content_owner = os.getenv("YT_CONTENT_OWNER")
+        self.fanout_concurrency = int(os.getenv("YT_FANOUT_CONCURRENCY", "3"))
+        self.renderer = RenderEngine()
+        self.render_cache = RenderCache()
+        self.jobs = jobs or JobQueue()
+        self.jobs.register("youtube_upload", self.run_upload_job)
+        self.jobs.register("render", self.run_render_job)
+        self.jobs.register("youtube_fanout", self.run_fanout_job)
 
     async def get_valid_credentials(self, user_id: int) -> Optional[Credentials]:
         try:
-            encrypted = await get_user_data(user_id, "youtube_token")
-            if not encrypted:
-                return None
-
-            token_data = json.loads(encrypted.decode())
-            expiry = datetime.fromisoformat(token_data["expiry"]).astimezone(timezone.utc)
-            now = datetime.now(timezone.utc)
-
-            if now > expiry - timedelta(minutes=5):
-                credentials = Credentials(**token_data)
-                credentials.refresh(Request())
-                token_data.update({
-                    "token": credentials.token,
-                    "expiry": credentials.expiry.astimezone(timezone.utc).isoformat()
-                })
-                encrypted = fernet.encrypt(json.dumps(token_data).encode())
-                await update_user_data(user_id, {"youtube_token": encrypted.decode()})
-
-            return Credentials(**token_data)
+            return await self.tokens.credentials(user_id)
         except Exception as e:
             logger.error(f"Credentials error: {str(e)}")
             return None
 
-    async def upload_video(self, user_id: int, video_path: str, metadata: dict) -> str:
+    async def upload_video(
+            self,
+            user_id: int,
+            video_path: str,
+            metadata: dict,
+            on_progress: Optional[Callable[[UploadProgress], Awaitable]] = None
+    ) -> str:
         credentials = await self.get_valid_credentials(user_id)
         if not credentials:
-            raise ValueError("❌ Authentication required")
+            raise PermanentJobError("❌ Authentication required")
+
+        youtube = self.clients.service(user_id, credentials)
+        return await self.uploader.upload(
+            user_id,
+            youtube,
+            video_path,
+            self.video_body(metadata),
+            on_progress
+        )
 
-        youtube = build("youtube", "v3", credentials=credentials)
-        request = youtube.videos().insert(
-            part="snippet,status",
-            body={
-                "snippet": {
-                    "title": metadata['title'],
-                    "description": metadata['description'],
-                    "tags": metadata['tags'],
-                    "categoryId": "10"
-                },
-                "status": {
-                    "privacyStatus": "private",
-                    "publishAt": metadata.get('publish_time'),
-                    "selfDeclaredMadeForKids": False
-                }
-            },
-            media_body=MediaFileUpload(video_path)
+    async def upload_telegram_video(
+            self,
+            user_id: int,
+            file_id: str,
+            file_unique_id: str,
+            file_size: int,
+            metadata: dict,
+            on_progress: Optional[Callable[[UploadProgress], Awaitable]] = None
+    ) -> str:
+        """Потоковая загрузка видео из Telegram в YouTube"""
+        file = await self.bot.get_file(file_id)
+        size = file_size or file.file_size
+        if not size:
+            # Без размера сессию resumable upload не открыть: загрузка через временный файл
+            path = Path("temp") / f"{user_id}_{uuid.uuid4().hex}.mp4"
+            try:
+                await self.bot.download_file(file.file_path, path, timeout=self.stream_timeout)
+                return await self.upload_video(user_id, str(path), metadata, on_progress)
+            finally:
+                path.unlink(missing_ok=True)
+
+        credentials = await self.get_valid_credentials(user_id)
+        if not credentials:
+            raise PermanentJobError("❌ Authentication required")
+
+        youtube = self.clients.service(user_id, credentials)
+        body = self.video_body(metadata)
+        # Ключ сессии не зависит от попытки: повтор продолжит загрузку с места обрыва
+        body_hash = hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()
+        return await self.uploader.upload_stream(
+            f"yt_upload:{user_id}:{file_unique_id}:{body_hash}",
+            youtube,
+            self.bot.session.stream_content(
+                url=self.bot.session.api.file_url(self.bot.token, file.file_path),
+                timeout=self.stream_timeout,
+                chunk_size=STREAM_CHUNK_SIZE
+            ),
+            size,
+            body,
+            on_progress
         )
-        return request.execute()["id"]
 
-    async def get_youtube_channels(self, user_id: int) -> List[Tuple[str, str]]:
-        try:
-            credentials = await self.get_valid_credentials(user_id)
-            if not credentials:
-                return []
+    @staticmethod
+    def video_body(metadata: dict) -> dict:
+        return {
+            "snippet": {
+                "title": metadata['title'],
+                "description": metadata['description'],
+                "tags": metadata['tags'],
+                "categoryId": "10"
+            },
+            "status": {
+                "privacyStatus": "private",
+                "publishAt": metadata.get('publish_time'),
+                "selfDeclaredMadeForKids": False
+            }
+        }
+
+    def progress_reporter(self, status_message: Message) -> Callable[[UploadProgress], Awaitable]:
+        """Обновление статусного сообщения не чаще раза в YT_PROGRESS_INTERVAL секунд"""
+        interval = float(os.getenv("YT_PROGRESS_INTERVAL", "5"))
+        last_update = [0.0]
+
+        async def report(progress: UploadProgress):
+            now = time.monotonic()
+            if now - last_update[0] < interval or progress.sent >= progress.total:
+                return
+            last_update[0] = now
+            try:
+                await status_message.edit_text(f"⏳ Видео загружается... {progress}")
+            except Exception as e:
+                logger.debug(f"Progress update skipped: {str(e)}")
+
+        return report
+
+    async def fetch_youtube_channels(self, user_id: int) -> List[Tuple[str, str]]:
+        """Список каналов напрямую из YouTube API"""
+        credentials = await self.get_valid_credentials(user_id)
+        if not credentials:
+            raise ValueError("❌ Authentication required")
 
-            youtube = build("youtube", "v3", credentials=credentials)
+        youtube = self.clients.service(user_id, credentials)
+        if self.content_owner:
             request = youtube.channels().list(
                 part="snippet",
-                mine=True,
-                managedByMe=True
+                managedByMe=True,
+                onBehalfOfContentOwner=self.content_owner,
+                maxResults=50
             )
-            response = request.execute()
-            return [
-                (item["id"], item["snippet"]["title"])
-                for item in response.get("items", [])
-            ]
+        else:
+            request = youtube.channels().list(part="snippet", mine=True)
+        with track(YOUTUBE_SECONDS, YOUTUBE_ERRORS, method="channels.list"):
+            response = await asyncio.get_running_loop().run_in_executor(None, request.execute)
+        return [
+            (item["id"], item["snippet"]["title"])
+            for item in response.get("items", [])
+        ]
+
+    async def get_youtube_channels(self, user_id: int) -> List[Tuple[str, str]]:
+        try:
+            return await self.channels.get(user_id)
         except Exception as e:
             logger.error(f"Channel fetch error: {str(e)}")
             return []
 
+    async def handle_refresh_channels(self, message: Message, state: FSMContext):
+        await self.channels.invalidate(message.from_user.id)
+        channels = await self.get_youtube_channels(message.from_user.id)
+        if not channels:
+            await message.answer("❌ Нет доступных каналов!")
+            return
+        await self.show_channel_selection(message, channels, state)
+
     async def handle_auth_start(self, message: Message, state: FSMContext):
         await state.clear()
         await message.answer("📤 Отправьте файл client_secrets.json.")
@@ -184,8 +281,8 @@ class YouTubeService:
                 "scopes": credentials.scopes
             }
 
-            encrypted = fernet.encrypt(json.dumps(token_data).encode())
-            await update_user_data(message.from_user.id, {"youtube_token": encrypted.decode()})
+            await self.tokens.store(message.from_user.id, token_data)
+            await self.channels.invalidate(message.from_user.id)
             await message.answer("✅ Авторизация успешна! Используйте /upload")
             await state.clear()
 
@@ -225,75 +322,184 @@ class YouTubeService:
         await state.set_state(self.states.CONTENT_TYPE)
 
     async def handle_media_upload(self, message: Message, state: FSMContext):
+        path = Path("temp") / f"{message.from_user.id}_{uuid.uuid4().hex}.mp4"
         try:
             video = message.video
-            file = await self.bot.get_file(video.file_id)
-            path = Path("temp") / f"{message.from_user.id}_video.mp4"
-            await self.bot.download_file(file.file_path, path)
-
-            await message.answer("⏳ Видео загружается...")
             data = await state.get_data()
-            metadata = data.get("video_metadata", {})
-
-            video_id = await self.upload_video(
-                user_id=message.from_user.id,
-                video_path=str(path),
-                metadata=metadata
-            )
+            payload = {"metadata": data.get("video_metadata", {})}
+
+            if self.stream_uploads:
+                # Видео пойдет из Telegram прямо в YouTube, без файла на диске
+                payload.update({
+                    "file_id": video.file_id,
+                    "file_unique_id": video.file_unique_id,
+                    "file_size": video.file_size,
+                })
+            else:
+                file = await self.bot.get_file(video.file_id)
+                await self.bot.download_file(file.file_path, path)
+                payload["video_path"] = str(path)
 
-            await message.answer(f"✅ Видео загружено! ID: {video_id}")
+            await self.jobs.enqueue("youtube_upload", message.from_user.id, message.chat.id, payload)
+            await message.answer("📥 Видео поставлено в очередь на загрузку")
             await state.clear()
 
         except Exception as e:
             await message.answer(f"❌ Ошибка загрузки: {str(e)}")
-        finally:
             if path.exists():
                 path.unlink()
 
-    async def generate_video(self, user_id: int, state: FSMContext):
-        data = await state.get_data()
-        output_path = Path("temp") / f"{user_id}_video.mp4"
+    async def run_upload_job(self, job: Job) -> str:
+        """Загрузка видео из очереди задач"""
+        status_message = await self.bot.send_message(job.chat_id, "⏳ Видео загружается...")
+        on_progress = self.progress_reporter(status_message)
 
+        path = Path(job.payload["video_path"]) if "video_path" in job.payload else None
+        finished = False
         try:
-            audio = AudioFileClip(data["audio_path"])
-            clip = ImageClip(data["photo_path"]).set_duration(audio.duration)
-            clip = clip.set_audio(audio)
-            clip.write_videofile(str(output_path), fps=24)
-
-            await state.update_data(video_path=str(output_path))
-            await self.bot.send_message(
-                user_id,
-                "✅ Видео готово!\nВведите метаданные в формате:\n"
-                "Название\nОписание\nТеги (через запятую)\nДата публикации (YYYY-MM-DDTHH:MM:SSZ или 'сейчас')"
-            )
-            await state.set_state(self.states.METADATA_INPUT)
+            if path is None:
+                video_id = await self.upload_telegram_video(
+                    user_id=job.user_id,
+                    file_id=job.payload["file_id"],
+                    file_unique_id=job.payload["file_unique_id"],
+                    file_size=job.payload["file_size"],
+                    metadata=job.payload["metadata"],
+                    on_progress=on_progress
+                )
+            else:
+                video_id = await self.upload_video(
+                    user_id=job.user_id,
+                    video_path=str(path),
+                    metadata=job.payload["metadata"],
+                    on_progress=on_progress
+                )
+            finished = True
+            await self.bot.send_message(job.chat_id, f"✅ Видео загружено! ID: {video_id}")
+            return video_id
+        except Exception as e:
+            if not self.is_permanent(e):
+                raise
+            # Повтора не будет: файл больше не нужен
+            finished = True
+            if isinstance(e, PermanentJobError):
+                raise
+            raise PermanentJobError(str(e)) from e
+        finally:
+            if path and (finished or job.is_last_attempt) and path.exists():
+                path.unlink()
+
+    @staticmethod
+    def is_permanent(error: BaseException) -> bool:
+        """Ошибка, которую повтор задачи не исправит: неверные метаданные,
+        отозванный доступ, исчерпанная квота"""
+        if isinstance(error, PermanentJobError):
+            return True
+        if not isinstance(error, HttpError):
+            return False
+        if error.resp.status in (400, 401):
+            return True
+        if error.resp.status == 403:
+            details = error.error_details if isinstance(error.error_details, list) else []
+            reasons = {detail.get("reason") for detail in details if isinstance(detail, dict)}
+            return not reasons & RETRYABLE_FORBIDDEN
+        return False
 
+    async def generate_video(self, user_id: int, state: FSMContext):
+        data = await state.get_data()
+        try:
+            key = await self.render_cache.key(data["photo_path"], data["audio_path"], self.render_settings())
+            if cached := self.render_cache.lookup(key):
+                # То же фото и аудио уже рендерились - сразу к метаданным
+                RENDER_CACHE.labels(result="hit").inc()
+                video_path = await self.render_cache.checkout(cached, str(user_id))
+                await self.request_metadata(user_id, state, str(video_path))
+                return
+
+            await self.jobs.enqueue("render", user_id, user_id, {
+                "photo_path": data["photo_path"],
+                "audio_path": data["audio_path"],
+                "cache_key": key,
+            })
+            await self.bot.send_message(user_id, "⏳ Видео поставлено в очередь на генерацию")
         except Exception as e:
             await self.bot.send_message(user_id, f"❌ Ошибка генерации: {str(e)}")
 
-    async def handle_metadata_input(self, message: Message, state: FSMContext):
-        try:
-            parts = message.text.split('\n')
-            if len(parts) != 4:
-                raise ValueError("Неверный формат")
+    async def run_render_job(self, job: Job) -> str:
+        """Генерация видео из фото и аудио в очереди задач"""
+        output_path, hit = await self.render_cache.get_or_render(
+            job.payload["cache_key"],
+            lambda path: self.renderer.render(
+                job.payload["photo_path"],
+                job.payload["audio_path"],
+                path
+            )
+        )
+        RENDER_CACHE.labels(result="hit" if hit else "miss").inc()
+        # Загрузка получает свою ссылку на файл: вытеснение из кэша ее не затронет
+        video_path = await self.render_cache.checkout(output_path, str(job.user_id))
+        await self.request_metadata(job.chat_id, self.user_state(job.user_id, job.chat_id), str(video_path))
+        return str(video_path)
+
+    def render_settings(self) -> dict:
+        """Параметры рендера, влияющие на результат (часть ключа кэша)"""
+        return {"backend": self.renderer.backend, **self.renderer.settings}
+
+    async def request_metadata(self, chat_id: int, state: FSMContext, video_path: str):
+        await state.update_data(video_path=video_path)
+        await self.bot.send_message(
+            chat_id,
+            "✅ Видео готово!\nВведите метаданные в формате:\n"
+            "Название\nОписание\nТеги (через запятую)\nДата публикации (YYYY-MM-DDTHH:MM:SSZ или 'сейчас')"
+        )
+        await state.set_state(self.states.METADATA_INPUT)
+
+    def user_state(self, user_id: int, chat_id: int) -> FSMContext:
+        """FSM-контекст пользователя вне обработчика (для воркеров очереди)"""
+        return FSMContext(
+            storage=self.dp.storage,
+            key=StorageKey(bot_id=self.bot.id, chat_id=chat_id, user_id=user_id)
+        )
 
-            title = parts[0].strip()
-            description = parts[1].strip()
-            tags = [tag.strip() for tag in parts[2].split(',')]
-            publish_time = parts[3].strip().lower()
+    @staticmethod
+    def parse_metadata(text: str) -> dict:
+        parts = text.split('\n')
+        if len(parts) != 4:
+            raise ValueError("Неверный формат")
 
-            if publish_time != 'сейчас':
-                publish_time = datetime.fromisoformat(publish_time).isoformat()
-            else:
-                publish_time = datetime.now(timezone.utc).isoformat()
-
-            await state.update_data(video_metadata={
-                'title': title,
-                'description': description,
-                'tags': tags,
-                'publish_time': publish_time,
-                'is_scheduled': publish_time != 'сейчас'
-            })
+        title = parts[0].strip()
+        description = parts[1].strip()
+        tags = [tag.strip() for tag in parts[2].split(',')]
+        publish_time = parts[3].strip().lower()
+
+        if publish_time != 'сейчас':
+            publish_time = datetime.fromisoformat(publish_time).isoformat()
+        else:
+            publish_time = datetime.now(timezone.utc).isoformat()
+
+        return {
+            'title': title,
+            'description': description,
+            'tags': tags,
+            'publish_time': publish_time,
+            'is_scheduled': publish_time != 'сейчас'
+        }
+
+    @staticmethod
+    def channel_metadata(template: dict, channel_name: str) -> dict:
+        """Метаданные для канала: {channel} в шаблоне заменяется названием канала"""
+        def fill(value: str) -> str:
+            return value.replace("{channel}", channel_name)
+
+        return {
+            **template,
+            'title': fill(template['title']),
+            'description': fill(template['description']),
+            'tags': [fill(tag) for tag in template['tags']]
+        }
+
+    async def handle_metadata_input(self, message: Message, state: FSMContext):
+        try:
+            await state.update_data(video_metadata=self.parse_metadata(message.text))
 
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="Да", callback_data="use_vpn"),
@@ -305,8 +511,214 @@ class YouTubeService:
         except Exception as e:
             await message.answer(f"❌ Ошибка формата: {str(e)}")
 
+    @staticmethod
+    def multi_channel_keyboard(channels: List[Tuple[str, str]], selected: List[str]) -> InlineKeyboardMarkup:
+        rows = [
+            [InlineKeyboardButton(text=f"{'✅' if id in selected else '▫️'} {name}", callback_data=f"mc:{id}")]
+            for id, name in channels
+        ]
+        rows.append([InlineKeyboardButton(text="Готово", callback_data="mc_done")])
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+
+    async def handle_multi_channel_start(self, callback: CallbackQuery, state: FSMContext):
+        if not self.content_owner:
+            await callback.answer(
+                "Мультиканальная загрузка доступна только аккаунтам владельцев контента",
+                show_alert=True
+            )
+            return
+
+        channels = await self.get_youtube_channels(callback.from_user.id)
+        if not channels:
+            await callback.message.answer("❌ Нет доступных каналов!")
+            await callback.answer()
+            return
+
+        await state.update_data(multi_channels=[])
+        await callback.message.answer(
+            "📡 Отметьте каналы для загрузки:",
+            reply_markup=self.multi_channel_keyboard(channels, [])
+        )
+        await state.set_state(self.states.MULTI_CHANNEL)
+        await callback.answer()
+
+    async def handle_multi_channel_toggle(self, callback: CallbackQuery, state: FSMContext):
+        data = await state.get_data()
+        selected = data.get("multi_channels", [])
+
+        if callback.data == "mc_done":
+            if not selected:
+                await callback.answer("Выберите хотя бы один канал")
+                return
+            await callback.message.edit_text(f"✅ Выбрано каналов: {len(selected)}")
+            await callback.message.answer(
+                "Введите шаблон метаданных в формате:\n"
+                "Название\nОписание\nТеги (через запятую)\nДата публикации (YYYY-MM-DDTHH:MM:SSZ или 'сейчас')\n\n"
+                "{channel} будет заменено названием канала"
+            )
+            await callback.answer()
+            return
+
+        channel_id = callback.data.removeprefix("mc:")
+        if channel_id in selected:
+            selected.remove(channel_id)
+        else:
+            selected.append(channel_id)
+        await state.update_data(multi_channels=selected)
+
+        channels = await self.get_youtube_channels(callback.from_user.id)
+        await callback.message.edit_reply_markup(reply_markup=self.multi_channel_keyboard(channels, selected))
+        await callback.answer()
+
+    async def handle_multi_channel_metadata(self, message: Message, state: FSMContext):
+        try:
+            await state.update_data(video_metadata=self.parse_metadata(message.text))
+        except Exception as e:
+            await message.answer(f"❌ Ошибка формата: {str(e)}")
+            return
+
+        data = await state.get_data()
+        if video_path := data.get("video_path"):
+            # Видео уже отрендерено - загружаем его на все каналы
+            await self.enqueue_fanout(message.from_user.id, message.chat.id, video_path, state)
+        else:
+            await message.answer("📤 Отправьте видео для загрузки на выбранные каналы")
+
+    async def handle_multi_channel_video(self, message: Message, state: FSMContext):
+        data = await state.get_data()
+        if "video_metadata" not in data:
+            await message.answer("❌ Сначала введите шаблон метаданных")
+            return
+
+        path = Path("temp") / f"{message.from_user.id}_{uuid.uuid4().hex}.mp4"
+        try:
+            file = await self.bot.get_file(message.video.file_id)
+            await self.bot.download_file(file.file_path, path)
+            await self.enqueue_fanout(message.from_user.id, message.chat.id, str(path), state)
+        except Exception as e:
+            await message.answer(f"❌ Ошибка загрузки: {str(e)}")
+            if path.exists():
+                path.unlink()
+
+    async def enqueue_fanout(self, user_id: int, chat_id: int, video_path: str, state: FSMContext):
+        data = await state.get_data()
+        names = dict(await self.get_youtube_channels(user_id))
+        channels = [(channel_id, names.get(channel_id, channel_id)) for channel_id in data["multi_channels"]]
+
+        await self.jobs.enqueue("youtube_fanout", user_id, chat_id, {
+            "video_path": video_path,
+            "metadata": data["video_metadata"],
+            "channels": channels,
+        })
+        await self.bot.send_message(chat_id, f"📥 Видео поставлено в очередь на загрузку в {len(channels)} каналов")
+        await state.clear()
+
+    async def run_fanout_job(self, job: Job) -> Dict[str, str]:
+        """Загрузка одного файла на несколько каналов одновременно.
+
+        Файл отображается в память один раз и читается всеми загрузками.
+        Уже загруженные каналы запоминаются в Redis и при повторе задачи
+        пропускаются.
+        """
+        results_key = f"yt_fanout:{job.id}"
+        uploaded = {
+            channel_id.decode(): video_id.decode()
+            for channel_id, video_id in (await storage.redis.hgetall(results_key)).items()
+        }
+        channels = [(channel_id, name) for channel_id, name in job.payload["channels"]]
+        pending = [(channel_id, name) for channel_id, name in channels if channel_id not in uploaded]
+        errors: Dict[str, str] = {}
+        permanent = set()
+        path = Path(job.payload["video_path"])
+
+        finished = False
+        try:
+            credentials = await self.get_valid_credentials(job.user_id)
+            if not credentials:
+                raise PermanentJobError("❌ Authentication required")
+            youtube = self.clients.service(job.user_id, credentials)
+
+            status_message = await self.bot.send_message(job.chat_id, f"⏳ Загрузка на каналы: {len(pending)}")
+            reporter = self.fanout_reporter(status_message, pending)
+            semaphore = asyncio.Semaphore(self.fanout_concurrency)
+
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                async def upload(channel_id: str, channel_name: str):
+                    async with semaphore:
+                        try:
+                            body = self.video_body(self.channel_metadata(job.payload["metadata"], channel_name))
+                            video_id = await self.uploader.upload_mapped(
+                                f"yt_upload:{job.user_id}:{job.id}:{channel_id}",
+                                youtube,
+                                mapping,
+                                body,
+                                reporter(channel_id),
+                                onBehalfOfContentOwner=self.content_owner,
+                                onBehalfOfContentOwnerChannel=channel_id
+                            )
+                            uploaded[channel_id] = video_id
+                            await storage.redis.hset(results_key, channel_id, video_id)
+                            await storage.redis.expire(results_key, self.jobs.result_ttl)
+                        except Exception as e:
+                            logger.error(f"Загрузка на канал {channel_id} не удалась: {str(e)}")
+                            errors[channel_id] = str(e)
+                            if self.is_permanent(e):
+                                permanent.add(channel_id)
+
+                await asyncio.gather(*(upload(channel_id, name) for channel_id, name in pending))
+
+            # Если повтор ничего не исправит, сразу отчитываемся о результатах
+            if errors and not job.is_last_attempt and set(errors) - permanent:
+                raise RuntimeError(f"Не загружено на каналы: {len(errors)} из {len(channels)}")
+
+            lines = []
+            for channel_id, name in channels:
+                if channel_id in uploaded:
+                    lines.append(f"✅ {name}: {uploaded[channel_id]}")
+                else:
+                    lines.append(f"❌ {name}: {errors.get(channel_id, 'не загружено')}")
+            await self.bot.send_message(job.chat_id, "📊 Результаты загрузки:\n" + "\n".join(lines))
+            await storage.redis.delete(results_key)
+            finished = True
+            return uploaded
+        except PermanentJobError:
+            finished = True
+            raise
+        finally:
+            if (finished or job.is_last_attempt) and path.exists():
+                path.unlink()
+
+    def fanout_reporter(
+            self,
+            status_message: Message,
+            channels: List[Tuple[str, str]]
+    ) -> Callable[[str], Callable[[UploadProgress], Awaitable]]:
+        """Общее статусное сообщение с прогрессом по каждому каналу"""
+        interval = float(os.getenv("YT_PROGRESS_INTERVAL", "5"))
+        names = dict(channels)
+        progress: Dict[str, str] = {channel_id: "в очереди" for channel_id in names}
+        last_update = [0.0]
+
+        def for_channel(channel_id: str) -> Callable[[UploadProgress], Awaitable]:
+            async def report(update: UploadProgress):
+                progress[channel_id] = "готово" if update.sent >= update.total else str(update)
+                now = time.monotonic()
+                if now - last_update[0] < interval:
+                    return
+                last_update[0] = now
+                text = "\n".join(f"{names[id]}: {status}" for id, status in progress.items())
+                try:
+                    await status_message.edit_text(f"⏳ Загрузка на каналы:\n{text}")
+                except Exception as e:
+                    logger.debug(f"Progress update skipped: {str(e)}")
+
+            return report
+
+        return for_channel
+
     def setup_routes(self):
         self.dp.message.register(self.handle_auth_start, Command("auth"))
+        self.dp.message.register(self.handle_refresh_channels, Command("refresh_channels"))
         self.dp.message.register(self.handle_oauth_file, self.states.OAUTH_FLOW, F.document)
         self.dp.message.register(self.handle_oauth_code, self.states.OAUTH_FLOW)
         self.dp.message.register(self.handle_media_upload, self.states.MEDIA_UPLOAD, F.video)
@@ -316,6 +728,15 @@ class YouTubeService:
             self.states.CHANNEL_SELECT
         )
 
+        self.dp.callback_query.register(
+            self.handle_multi_channel_start,
+            self.states.CONTENT_TYPE,
+            F.data == "multi_channel"
+        )
+        self.dp.callback_query.register(self.handle_multi_channel_toggle, self.states.MULTI_CHANNEL)
+        self.dp.message.register(self.handle_multi_channel_video, self.states.MULTI_CHANNEL, F.video)
+        self.dp.message.register(self.handle_multi_channel_metadata, self.states.MULTI_CHANNEL, F.text)
+
         self.dp.message.register(
             self.handle_metadata_input,
             self.states.METADATA_INPUT
@@ -358,14 +779,8 @@ class YouTubeService:
             await message.answer(f"❌ Ошибка: {str(e)}")
 
     async def handle_channel_select(self, message: Message, state: FSMContext):
-        channels = await self.get_youtube_channels(message.from_user.id)
+        channels = await self.get_youtube_channels(message.chat.id)
         if not channels:
             await message.answer("❌ Нет доступных каналов!")
             return
-
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=name, callback_data=id)]
-            for id, name in channels
-        ])
-        await message.answer("📡 Выберите канал:", reply_markup=keyboard)
-        await state.set_state(self.states.CHANNEL_SELECT)
\ No newline at end of file
+        await self.show_channel_selection(message, channels, state)
@@ -0,0 +1,346 @@
+# src/youtube_upload.py
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaUpload
+
+from .metrics import UPLOAD_BYTES, YOUTUBE_ERRORS, YOUTUBE_SECONDS, track
+from .utils import storage
+
+logger = logging.getLogger(__name__)
+
+# Сессия возобновляемой загрузки YouTube живет около недели
+UPLOAD_SESSION_TTL = 7 * 24 * 3600
+FINGERPRINT_SAMPLE = 1024 * 1024
+
+
+class UploadProgress:
+    """Состояние загрузки для отображения пользователю"""
+
+    def __init__(self, sent: int, total: int, started_at: float, resumed_from: int = 0):
+        self.sent = sent
+        self.total = total
+        self.elapsed = max(time.monotonic() - started_at, 1e-6)
+        self.resumed_from = resumed_from
+
+    @property
+    def percent(self) -> float:
+        return 100.0 * self.sent / self.total if self.total else 100.0
+
+    @property
+    def throughput(self) -> float:
+        """Скорость текущего запуска в байтах в секунду"""
+        return (self.sent - self.resumed_from) / self.elapsed
+
+    def __str__(self):
+        return f"{self.percent:.0f}% ({self.throughput / 1024 / 1024:.1f} МБ/с)"
+
+
+class StreamingMediaUpload(MediaUpload):
+    """MediaUpload поверх потока байтов без промежуточного файла.
+
+    Асинхронная сторона (feed) дописывает данные в буфер, поток загрузки
+    читает их через getbytes. В буфере хранится не больше capacity байт
+    начиная с подтвержденного сервером смещения: этого достаточно для
+    повтора неудачного чанка, а память не зависит от размера видео.
+    Байты до подтвержденного смещения (например, при возобновлении
+    после перезапуска) отбрасываются на лету.
+    """
+
+    def __init__(self, size: int, chunksize: int, mimetype: str = "video/*", capacity: Optional[int] = None):
+        self._size = size
+        self._chunksize = chunksize
+        self._mimetype = mimetype
+        self._capacity = capacity or 2 * chunksize
+        self._data = bytearray()
+        self._base = 0  # абсолютное смещение первого байта буфера
+        self._committed = 0
+        self._eof = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._space = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def rewindable(self) -> bool:
+        """Можно ли начать загрузку заново: начало потока еще не отброшено"""
+        with self._cond:
+            return self._base == 0
+
+    def getbytes(self, begin, length):
+        """Вызывается из потока загрузки googleapiclient"""
+        end = min(begin + length, self._size)
+        with self._cond:
+            if begin < self._base:
+                raise IOError(f"Данные до {self._base} уже отброшены, запрошено {begin}")
+            self._committed = begin
+            self._discard()
+            self._notify_space()
+            while self._base + len(self._data) < end and not self._eof and not self._error:
+                self._cond.wait()
+            if self._error:
+                raise IOError(f"Ошибка источника: {self._error}")
+            return bytes(self._data[begin - self._base:end - self._base])
+
+    async def feed(self, chunks: AsyncIterator[bytes]):
+        """Перекачка источника в буфер с ожиданием свободного места"""
+        self._loop = asyncio.get_running_loop()
+        try:
+            async for chunk in chunks:
+                while True:
+                    with self._cond:
+                        if len(self._data) < self._capacity:
+                            self._data.extend(chunk)
+                            self._discard()
+                            self._cond.notify_all()
+                            break
+                        self._space.clear()
+                    await self._space.wait()
+        except BaseException as e:
+            self.close(e)
+            raise
+        else:
+            self.close()
+
+    def close(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self._eof = True
+            if error and not self._error:
+                self._error = error
+            self._cond.notify_all()
+
+    def _discard(self):
+        drop = min(self._committed - self._base, len(self._data))
+        if drop > 0:
+            del self._data[:drop]
+            self._base += drop
+
+    def _notify_space(self):
+        if self._loop and len(self._data) < self._capacity:
+            self._loop.call_soon_threadsafe(self._space.set)
+
+
+class MappedMediaUpload(MediaUpload):
+    """MediaUpload поверх общего read-only отображения файла (mmap).
+
+    Несколько загрузок одного файла читают одно отображение, каждая по своим
+    смещениям: ни собственных файловых дескрипторов, ни буферов на весь файл.
+    """
+
+    def __init__(self, mapping: mmap.mmap, chunksize: int, mimetype: str = "video/*"):
+        self._mapping = mapping
+        self._chunksize = chunksize
+        self._mimetype = mimetype
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return len(self._mapping)
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def getbytes(self, begin, length):
+        return self._mapping[begin:begin + length]
+
+
+class ResumableUploader:
+    """Возобновляемая загрузка видео на YouTube по частям.
+
+    Каждый чанк отправляется в пуле потоков. URI сессии и подтвержденное
+    смещение сохраняются в Redis после каждого чанка, поэтому после
+    перезапуска бота загрузка того же файла продолжается с места обрыва.
+    """
+
+    def __init__(self, chunk_size: Optional[int] = None, num_retries: Optional[int] = None):
+        # Размер чанка должен быть кратен 256 КБ
+        self.chunk_size = chunk_size or int(os.getenv("YT_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+        self.num_retries = num_retries or int(os.getenv("YT_UPLOAD_RETRIES", "5"))
+
+    @staticmethod
+    def fingerprint(video_path: str, body: Dict) -> str:
+        """Отпечаток файла по размеру, началу и концу, плюс метаданные"""
+        size = os.path.getsize(video_path)
+        digest = hashlib.sha1(str(size).encode())
+        with open(video_path, "rb") as f:
+            digest.update(f.read(FINGERPRINT_SAMPLE))
+            if size > FINGERPRINT_SAMPLE:
+                f.seek(max(size - FINGERPRINT_SAMPLE, FINGERPRINT_SAMPLE))
+                digest.update(f.read())
+        digest.update(json.dumps(body, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    async def upload(
+            self,
+            user_id: int,
+            youtube: Any,
+            video_path: str,
+            body: Dict,
+            on_progress: Optional[Callable[[UploadProgress], Awaitable]] = None
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        fingerprint = await loop.run_in_executor(None, self.fingerprint, video_path, body)
+        key = f"yt_upload:{user_id}:{fingerprint}"
+        media = MediaFileUpload(video_path, mimetype="video/*", chunksize=self.chunk_size, resumable=True)
+        return await self.upload_media(key, youtube, media, body, on_progress)
+
+    async def upload_stream(
+            self,
+            key: str,
+            youtube: Any,
+            chunks: AsyncIterator[bytes],
+            size: int,
+            body: Dict,
+            on_progress: Optional[Callable[[UploadProgress], Awaitable]] = None
+    ) -> str:
+        """Загрузка из асинхронного потока байтов известного размера"""
+        media = StreamingMediaUpload(size, self.chunk_size)
+        feeder = asyncio.create_task(media.feed(chunks))
+        try:
+            return await self.upload_media(key, youtube, media, body, on_progress)
+        finally:
+            feeder.cancel()
+            media.close(asyncio.CancelledError())
+            await asyncio.gather(feeder, return_exceptions=True)
+
+    async def upload_mapped(
+            self,
+            key: str,
+            youtube: Any,
+            mapping: mmap.mmap,
+            body: Dict,
+            on_progress: Optional[Callable[[UploadProgress], Awaitable]] = None,
+            **params
+    ) -> str:
+        """Загрузка из общего mmap (одновременные загрузки одного файла)"""
+        media = MappedMediaUpload(mapping, self.chunk_size)
+        return await self.upload_media(key, youtube, media, body, on_progress, **params)
+
+    @staticmethod
+    def _query_session(request: Any, media: Any) -> Tuple[int, Optional[Dict]]:
+        """Состояние сессии по протоколу resumable upload (выполняется в пуле потоков).
+
+        Пустой PUT с Content-Range: bytes */N: 308 с заголовком Range - сколько
+        байт принято, 200/201 - видео уже загружено целиком.
+        """
+        resp, content = request.http.request(
+            request.resumable_uri,
+            method="PUT",
+            body=b"",
+            headers={"Content-Length": "0", "Content-Range": f"bytes */{media.size()}"}
+        )
+        if resp.status == 308:
+            received = resp.get("range")
+            return (int(received.rsplit("-", 1)[-1]) + 1 if received else 0), None
+        if resp.status in (200, 201):
+            return media.size(), json.loads(content)
+        raise HttpError(resp, content, uri=request.resumable_uri)
+
+    async def _restart(
+            self,
+            key: str,
+            youtube: Any,
+            media: Any,
+            body: Dict,
+            on_progress: Optional[Callable[[UploadProgress], Awaitable]] = None,
+            **params
+    ) -> str:
+        """Сессия истекла - начинаем загрузку заново"""
+        await storage.redis.delete(key)
+        if isinstance(media, StreamingMediaUpload) and not media.rewindable():
+            # Поток не перемотать: повтор задачи скачает видео заново
+            raise IOError(f"Сессия загрузки {key} недействительна, а начало потока уже отброшено")
+        logger.warning(f"Сессия загрузки {key} недействительна, загрузка с нуля")
+        return await self.upload_media(key, youtube, media, body, on_progress, **params)
+
+    async def upload_media(
+            self,
+            key: str,
+            youtube: Any,
+            media: Any,
+            body: Dict,
+            on_progress: Optional[Callable[[UploadProgress], Awaitable]] = None,
+            **params
+    ) -> str:
+        """Загрузка произвольного MediaUpload с сохранением сессии под ключом key.
+
+        params - дополнительные параметры videos.insert.
+        """
+        loop = asyncio.get_running_loop()
+        request = youtube.videos().insert(part="snippet,status", body=body, media_body=media, **params)
+
+        resumed_from = 0
+        response = None
+        saved = await storage.redis.hgetall(key)
+        if saved:
+            # Сохраненное смещение может отставать от сервера: спрашиваем фактическое
+            request.resumable_uri = saved[b"uri"].decode()
+            try:
+                with track(YOUTUBE_SECONDS, YOUTUBE_ERRORS, method="videos.insert"):
+                    resumed_from, response = await loop.run_in_executor(None, self._query_session, request, media)
+            except HttpError as e:
+                if e.resp.status in (404, 410):
+                    return await self._restart(key, youtube, media, body, on_progress, **params)
+                raise
+            request.resumable_progress = resumed_from
+            logger.info(f"Возобновление загрузки {key} с {resumed_from} байт")
+
+        started_at = time.monotonic()
+        next_chunk = functools.partial(request.next_chunk, num_retries=self.num_retries)
+        sent = resumed_from
+        while response is None:
+            try:
+                with track(YOUTUBE_SECONDS, YOUTUBE_ERRORS, method="videos.insert"):
+                    status, response = await loop.run_in_executor(None, next_chunk)
+            except HttpError as e:
+                if saved and e.resp.status in (404, 410):
+                    return await self._restart(key, youtube, media, body, on_progress, **params)
+                raise
+
+            progress = media.size() if response is not None else request.resumable_progress
+            UPLOAD_BYTES.inc(max(progress - sent, 0))
+            sent = progress
+
+            if response is None:
+                await storage.redis.hset(key, mapping={
+                    "uri": request.resumable_uri,
+                    "offset": request.resumable_progress,
+                })
+                await storage.redis.expire(key, UPLOAD_SESSION_TTL)
+                if on_progress:
+                    await on_progress(UploadProgress(status.resumable_progress, media.size(), started_at, resumed_from))
+
+        await storage.redis.delete(key)
+        if on_progress:
+            await on_progress(UploadProgress(media.size(), media.size(), started_at, resumed_from))
+        return response["id"]